@@ -0,0 +1,147 @@
+import hashlib
+import math
+import random
+import time
+from uuid import uuid4
+
+from django.core.cache import cache as default_cache
+
+TAG_KEY = 'posts:tag:{}'
+CARD_KEY = 'posts:card:{}:{}'
+CARD_TIMEOUT = 60 * 60 * 24
+LOCK_KEY = 'posts:lock:{}'
+LOCK_TIMEOUT = 30
+STALE_TIMEOUT = 60 * 5
+EARLY_REFRESH_BETA = 1.0
+WAIT_STEP = 0.05
+WAIT_STEPS = 10
+
+
+def _tag_keys(tags):
+    return {TAG_KEY.format(tag): tag for tag in tags}
+
+
+def _new_versions(keys):
+    now = time.time()
+    return {key: f'{now:f}:{uuid4().hex}' for key in keys}
+
+
+def version_time(version):
+    """Время сброса тега, записанное в его версии, или None."""
+    stamp, _, _ = version.rpartition(':')
+    try:
+        return float(stamp)
+    except ValueError:
+        return None
+
+
+def post_cache_tags(post):
+    tags = ['feed', f'post:{post.pk}', f'author:{post.author_id}']
+    for group_id in {post.group_id, getattr(post, '_old_group_id', None)}:
+        if group_id is not None:
+            tags.append(f'group:{group_id}')
+    return tags
+
+
+def card_key(post):
+    """Ключ карточки записи из всего, что на ней видно.
+
+    Правка текста, группы или картинки и новый комментарий меняют ключ,
+    поэтому карточки не нужно сбрасывать. Запись должна быть получена
+    через Post.objects.for_listing().
+    """
+    group = post.group
+    version = '\0'.join(map(str, (
+        post.text, post.image.name, post.image_placeholder,
+        post.pub_date.isoformat(),
+        post.author.username, post.comment_count,
+        group and group.slug, group and group.title,
+    )))
+    return CARD_KEY.format(
+        post.pk, hashlib.md5(version.encode()).hexdigest())
+
+
+def invalidate(*tags, cache=default_cache):
+    """Сбрасывает все записи кеша, зависящие от перечисленных тегов."""
+    cache.set_many(_new_versions(_tag_keys(tags)), None)
+
+
+def _versions(keys, stored, cache):
+    missing = _new_versions(
+        tag_key for tag_key in keys if tag_key not in stored)
+    if missing:
+        cache.set_many(missing, None)
+        stored.update(missing)
+    return {keys[tag_key]: version for tag_key, version in stored.items()}
+
+
+def _lookup(key, tags, cache):
+    keys = _tag_keys(tags)
+    stored = cache.get_many([key, *keys])
+    entry = stored.pop(key, None)
+    return entry, _versions(keys, stored, cache)
+
+
+def tag_versions(tags, cache=default_cache):
+    """Текущие версии тегов; недостающие создаются."""
+    keys = _tag_keys(tags)
+    return _versions(keys, cache.get_many(list(keys)), cache)
+
+
+def tag_page(request, *tags):
+    """Помечает ответ тегами для кеша страниц (posts.middleware).
+
+    Вызывается до чтения данных страницы: сброс тега во время рендеринга
+    не даст сохранить устаревшую страницу.
+    """
+    if getattr(request, 'page_cache_key', None) is not None:
+        request.page_cache_versions = tag_versions(tags)
+
+
+def _is_fresh(entry, versions):
+    entry_versions, _, expires, delta = entry
+    if entry_versions != versions:
+        return False
+    jitter = -delta * EARLY_REFRESH_BETA * math.log(1 - random.random())
+    return time.time() + jitter < expires
+
+
+def _wait(key, versions, cache):
+    for _ in range(WAIT_STEPS):
+        time.sleep(WAIT_STEP)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == versions:
+            return entry
+    return None
+
+
+def get_or_build(key, tags, build, timeout, cache=default_cache):
+    """Значение из кеша; при промахе его пересчитывает один процесс.
+
+    Запись живёт timeout секунд и ещё STALE_TIMEOUT после этого. Когда
+    она устарела или сброшен один из её тегов, пересчёт берёт на себя
+    тот, кто первым захватил блокировку, а остальные отдают старое
+    значение. Незадолго до истечения запись с вероятностью, растущей
+    со временем пересчёта, обновляется заранее.
+    """
+    entry, versions = _lookup(key, tags, cache)
+    if entry is not None and _is_fresh(entry, versions):
+        return entry[1]
+    lock = LOCK_KEY.format(key)
+    locked = cache.add(lock, True, LOCK_TIMEOUT)
+    if not locked:
+        if entry is not None:
+            return entry[1]
+        entry = _wait(key, versions, cache)
+        if entry is not None:
+            return entry[1]
+    try:
+        started = time.monotonic()
+        value = build()
+        delta = time.monotonic() - started
+        cache.set(key, (versions, value, time.time() + timeout, delta),
+                  timeout + STALE_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock)
+    return value
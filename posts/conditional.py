@@ -0,0 +1,97 @@
+import hashlib
+import json
+import time
+from datetime import datetime, timezone
+
+from django.contrib.auth import get_user_model
+from django.views.decorators.http import condition
+
+from .cache import tag_versions, version_time
+from .models import Group, Post
+
+User = get_user_model()
+
+
+def index_page_tags():
+    return ['feed']
+
+
+def group_page_tags(group_id):
+    return [f'group:{group_id}']
+
+
+def profile_page_tags(author_id):
+    return [f'author:{author_id}', f'stats:{author_id}']
+
+
+def post_page_tags(post):
+    tags = [f'post:{post.pk}', f'author:{post.author_id}',
+            f'stats:{post.author_id}']
+    if post.group_id is not None:
+        tags.append(f'group:{post.group_id}')
+    return tags
+
+
+def group_tags(slug):
+    group_id = Group.objects.filter(slug=slug).order_by().values_list(
+        'pk', flat=True).first()
+    return None if group_id is None else group_page_tags(group_id)
+
+
+def profile_tags(username):
+    author_id = User.objects.filter(username=username).order_by().values_list(
+        'pk', flat=True).first()
+    return None if author_id is None else profile_page_tags(author_id)
+
+
+def post_tags(username, post_id):
+    posts = Post.objects.filter(
+        pk=post_id, author__username=username
+    ).order_by().only('pk', 'author_id', 'group_id')[:1]
+    return next((post_page_tags(post) for post in posts), None)
+
+
+def page_etag(request, versions):
+    """ETag страницы: версии её тегов, пользователь и адрес."""
+    user = getattr(request, 'user', None)
+    payload = json.dumps([
+        sorted(versions.items()),
+        getattr(user, 'pk', None),
+        request.get_full_path(),
+    ])
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def page_last_modified(versions):
+    """Время последнего сброса тегов страницы."""
+    stamps = [version_time(version) for version in versions.values()]
+    if None in stamps:
+        stamps.append(time.time())
+    return datetime.fromtimestamp(max(stamps), timezone.utc)
+
+
+def conditional_page(get_tags):
+    """Отвечает 304 на If-None-Match и If-Modified-Since.
+
+    Валидаторы считаются по версиям тегов страницы, тех же, что она
+    передаёт в tag_page(): страница не рендерится, а база затрагивается
+    разве что одним запросом по первичному ключу или slug.
+    """
+    def versions(request, *args, **kwargs):
+        if not hasattr(request, 'conditional_versions'):
+            tags = get_tags(*args, **kwargs)
+            request.conditional_versions = (
+                None if tags is None else tag_versions(tags))
+        return request.conditional_versions
+
+    def etag(request, *args, **kwargs):
+        page_versions = versions(request, *args, **kwargs)
+        if page_versions is not None:
+            return page_etag(request, page_versions)
+
+    def last_modified(request, *args, **kwargs):
+        page_versions = versions(request, *args, **kwargs)
+        if page_versions is not None:
+            return page_last_modified(page_versions)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,71 @@
+from django.core.cache import caches
+
+from .cache import invalidate
+from .models import FeedItem, Follow, Post
+from .pagination import forget_counts
+
+BATCH_SIZE = 500
+FEED_CACHE = 'feeds'
+
+
+def follower_ids(author_id):
+    return list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+
+
+def authors_follower_ids(author_ids):
+    """Подписчики всех авторов из author_ids, без повторов."""
+    return list(Follow.objects.filter(author_id__in=author_ids).values_list(
+        'user_id', flat=True).distinct())
+
+
+def forget_feed_counts(user_ids):
+    forget_counts(f'feed:{user_id}' for user_id in user_ids)
+
+
+def invalidate_feeds(user_ids):
+    """Сбрасывает закешированные страницы лент пользователей."""
+    invalidate(
+        *(f'timeline:{user_id}' for user_id in user_ids),
+        cache=caches[FEED_CACHE]
+    )
+
+
+def fan_out_post(post):
+    """Раскладывает новую запись по лентам всех подписчиков автора."""
+    followers = follower_ids(post.author_id)
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id,
+                  post=post,
+                  author_id=post.author_id,
+                  pub_date=post.pub_date)
+         for user_id in followers),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    forget_feed_counts(followers)
+    invalidate_feeds(followers)
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту пользователя все записи нового автора."""
+    posts = Post.objects.filter(
+        author_id=author_id).values_list('pk', 'pub_date')
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id,
+                  post_id=post_id,
+                  author_id=author_id,
+                  pub_date=pub_date)
+         for post_id, pub_date in posts.iterator()),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+    forget_feed_counts([user_id])
+    invalidate_feeds([user_id])
+
+
+def trim_feed(user_id, author_id):
+    """Убирает из ленты пользователя записи автора после отписки."""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+    forget_feed_counts([user_id])
+    invalidate_feeds([user_id])
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from .images import ingest_image
 from .models import Comment, Post
 
 
@@ -8,6 +10,28 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('group', 'text', 'image')
 
+    def clean_image(self):
+        """Готовит новую картинку к хранению: см. ingest_image()."""
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        try:
+            return ingest_image(image)
+        except OSError:
+            raise forms.ValidationError(
+                self.fields['image'].error_messages['invalid_image'],
+                code='invalid_image')
+
+    def save(self, commit=True):
+        image = self.cleaned_data.get('image')
+        if not image:
+            metadata = {'image_placeholder': ''}
+        else:
+            metadata = getattr(image, 'image_metadata', {})
+        for field, value in metadata.items():
+            setattr(self.instance, field, value)
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,98 @@
+import base64
+import json
+import re
+
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .forms import CommentForm
+from .models import Follow
+
+MARKER = '<!--hole:{}-->'
+MARKER_RE = re.compile(r'<!--hole:([A-Za-z0-9_=-]+)-->')
+HOLES = {}
+
+
+def hole(template_name):
+    """Регистрирует дырку: шаблон и функцию, дополняющую его контекст."""
+    def register(func):
+        HOLES[func.__name__] = (template_name, func)
+        return func
+    return register
+
+
+@hole('includes/nav.html')
+def nav(request):
+    return {}
+
+
+@hole('posts/menu.html')
+def menu(request, **active):
+    return active
+
+
+@hole('includes/edit_button.html')
+def edit_button(request, **post):
+    return post
+
+
+@hole('includes/post_actions.html')
+def post_actions(request, **post):
+    return post
+
+
+@hole('includes/follow_button.html')
+def follow_button(request, author_id, username):
+    user = getattr(request, 'user', None)
+    return {
+        'username': username,
+        'follow_check': user is not None and user.is_authenticated
+        and Follow.objects.filter(user=user, author_id=author_id).exists(),
+    }
+
+
+@hole('includes/comment_form.html')
+def comment_form(request, **post):
+    return {'form': CommentForm(), **post}
+
+
+def render_hole(request, name, kwargs):
+    template_name, get_context = HOLES[name]
+    return render_to_string(
+        template_name, get_context(request, **kwargs), request)
+
+
+def hole_marker(name, kwargs):
+    payload = json.dumps([name, kwargs], separators=(',', ':'))
+    return mark_safe(MARKER.format(
+        base64.urlsafe_b64encode(payload.encode()).decode()))
+
+
+def fill_holes(request, skeleton):
+    """Подставляет в общий скелет страницы части для текущего пользователя."""
+    rendered = {}
+
+    def fill(match):
+        payload = match.group(1)
+        if payload not in rendered:
+            name, kwargs = json.loads(base64.urlsafe_b64decode(payload))
+            rendered[payload] = render_hole(request, name, kwargs)
+        return rendered[payload]
+
+    return MARKER_RE.sub(fill, skeleton)
+
+
+def render_page(request, template_name, context):
+    """Рендерит страницу как общий скелет и заполняет его дырки.
+
+    Скелет остаётся в request.page_skeleton: его кеширует
+    posts.middleware, чтобы отдавать любому пользователю.
+    """
+    request.page_holes = True
+    try:
+        skeleton = render_to_string(template_name, context, request)
+    finally:
+        request.page_holes = False
+    request.page_skeleton = skeleton
+    return HttpResponse(fill_holes(request, skeleton))
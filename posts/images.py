@@ -0,0 +1,109 @@
+import os
+from base64 import b64encode
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+CONTENT_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+FALLBACK_FORMAT = 'PNG'
+FALLBACK_MODES = ('1', 'L', 'LA', 'I', 'P', 'RGB', 'RGBA')
+KEEP_INFO = ('icc_profile', 'transparency', 'background', 'duration', 'loop')
+PLACEHOLDER_SIZE = (32, 11)
+PLACEHOLDER_QUALITY = 40
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 90},
+}
+
+
+def open_image(file_):
+    """Открывает изображение, прочитав только заголовок.
+
+    Размеры проверяются до декодирования: картинка больше
+    IMAGE_MAX_PIXELS отклоняется, не заняв память под пиксели.
+    """
+    file_.seek(0)
+    image = Image.open(file_)
+    width, height = image.size
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Изображение слишком большое: %(width)s×%(height)s.',
+            code='image_too_large',
+            params={'width': width, 'height': height})
+    return image
+
+
+def placeholder(image):
+    """Крошечная копия кадра карточки (LQIP) в виде data: URI.
+
+    Пропорции PLACEHOLDER_SIZE совпадают с миниатюрой карточки, поэтому
+    браузер растягивает заглушку на место будущей картинки.
+    """
+    tiny = ImageOps.fit(image, PLACEHOLDER_SIZE, Image.BILINEAR)
+    output = BytesIO()
+    tiny.convert('RGB').save(output, 'JPEG', quality=PLACEHOLDER_QUALITY)
+    return 'data:image/jpeg;base64,' + b64encode(output.getvalue()).decode()
+
+
+def image_metadata(image):
+    """Поля Post, описывающие картинку: заглушка карточки."""
+    return {'image_placeholder': placeholder(image)}
+
+
+def read_metadata(file_):
+    """image_metadata() уже сохранённого файла.
+
+    JPEG для заглушки декодируется в самом мелком масштабе.
+    """
+    image = open_image(file_)
+    image.draft(None, PLACEHOLDER_SIZE)
+    return image_metadata(image)
+
+
+def ingest_image(file_):
+    """Загруженное изображение в том виде, в каком его стоит хранить.
+
+    Картинка уменьшается так, чтобы большая сторона не превышала
+    IMAGE_MAX_SIDE (JPEG сразу декодируется в уменьшенном масштабе),
+    поворачивается по EXIF и сохраняется заново без метаданных.
+    Форматы кроме JPEG, PNG, GIF и WebP (BMP, TIFF и прочие, что
+    открывает Pillow) пересохраняются в PNG. Анимация не пересобирается
+    и хранится как есть. У возвращённого
+    файла есть image_metadata — поля для записи, см. image_metadata().
+    """
+    image = open_image(file_)
+    if getattr(image, 'is_animated', False):
+        file_.image_metadata = image_metadata(image)
+        file_.seek(0)
+        return file_
+    image_format = image.format
+    if image_format not in CONTENT_TYPES:
+        image_format = FALLBACK_FORMAT
+    max_side = settings.IMAGE_MAX_SIDE
+    image.draft(None, (max_side, max_side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if image_format == FALLBACK_FORMAT and image.mode not in FALLBACK_MODES:
+        image = image.convert('RGBA')
+    image.info = {
+        key: value for key, value in image.info.items() if key in KEEP_INFO}
+    output = BytesIO()
+    image.save(
+        output, image_format, icc_profile=image.info.get('icc_profile'),
+        **SAVE_OPTIONS.get(image_format, {}))
+    name = os.path.splitext(os.path.basename(file_.name))[0]
+    ingested = SimpleUploadedFile(
+        name + EXTENSIONS[image_format], output.getvalue(),
+        CONTENT_TYPES[image_format])
+    ingested.image_metadata = image_metadata(image)
+    return ingested
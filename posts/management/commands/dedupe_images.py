@@ -0,0 +1,47 @@
+from collections import defaultdict
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts.cache import invalidate, post_cache_tags
+from posts.models import Post
+from posts.storage import is_content_name, post_images
+from posts.thumbnails import delete_thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки записей в хранилище по хешу содержимого, '
+            'объединяя одинаковые файлы')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет перенесено')
+
+    def handle(self, *args, **options):
+        posts = defaultdict(list)
+        legacy = Post.objects.exclude(image='').exclude(image=None).only(
+            'pk', 'image', 'author_id', 'group_id')
+        for post in legacy.iterator():
+            if not is_content_name(post.image.name):
+                posts[post.image.name].append(post)
+        moved = missing = 0
+        for name, group in posts.items():
+            if not post_images.exists(name):
+                self.stderr.write(f'Нет файла {name}')
+                missing += 1
+                continue
+            if options['dry_run']:
+                self.stdout.write(name)
+                moved += 1
+                continue
+            with post_images.open(name) as content:
+                new_name = post_images.save(name, content)
+            Post.objects.filter(image=name).update(image=new_name)
+            delete_thumbnails(name, (default_storage, post_images))
+            post_images.delete(name)
+            for post in group:
+                invalidate(*post_cache_tags(post))
+            moved += 1
+        self.stdout.write(
+            f'Перенесено файлов: {moved}, не найдено: {missing}')
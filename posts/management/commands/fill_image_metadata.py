@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+
+from posts.cache import invalidate, post_cache_tags
+from posts.images import read_metadata
+from posts.models import Post
+from posts.storage import post_images
+
+
+class Command(BaseCommand):
+    help = 'Заполняет заглушки картинок, загруженных раньше'
+
+    def handle(self, *args, **options):
+        posts = defaultdict(list)
+        pending = Post.objects.exclude(image='').exclude(image=None).filter(
+            image_placeholder='').only('pk', 'image', 'author_id', 'group_id')
+        for post in pending.iterator():
+            posts[post.image.name].append(post)
+        filled = skipped = 0
+        for name, group in posts.items():
+            try:
+                with post_images.open(name) as file_:
+                    metadata = read_metadata(file_)
+            except (OSError, SyntaxError, ValidationError) as error:
+                self.stderr.write(f'Пропущен {name}: {error}')
+                skipped += 1
+                continue
+            Post.objects.filter(image=name).update(**metadata)
+            for post in group:
+                invalidate(*post_cache_tags(post))
+            filled += 1
+        self.stdout.write(
+            f'Обработано картинок: {filled}, пропущено: {skipped}')
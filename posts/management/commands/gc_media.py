@@ -0,0 +1,123 @@
+import posixpath
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+
+from posts.models import Post
+from posts.storage import post_images
+from posts.thumbnails import delete_thumbnails
+
+UPLOAD_DIR = Post._meta.get_field('image').upload_to
+
+
+def walk(storage, path):
+    """Имена всех файлов в каталоге хранилища и его подкаталогах."""
+    if not storage.exists(path):
+        return
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки, на которые не ссылается ни одна запись, '
+            'их миниатюры и записи sorl-thumbnail')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько объектов удалять за один подход')
+        parser.add_argument(
+            '--pause', type=float, default=0,
+            help='Пауза между подходами, в секундах')
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help='Остановиться после стольких подходов на каждом шаге')
+        parser.add_argument(
+            '--grace', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, что будет удалено')
+
+    def sweep(self, label, candidates, delete):
+        batches = iter(lambda: list(islice(candidates, self.batch_size)), [])
+        removed = 0
+        for number, batch in enumerate(batches, 1):
+            if number > 1:
+                time.sleep(self.pause)
+            if not self.dry_run:
+                for item in batch:
+                    delete(item)
+            removed += len(batch)
+            if number == self.max_batches:
+                break
+        self.stdout.write(f'{label}: {removed}')
+
+    def is_old(self, storage, name):
+        return storage.get_modified_time(name) < self.cutoff
+
+    def orphan_originals(self, referenced):
+        for name in walk(post_images, UPLOAD_DIR.rstrip('/')):
+            if name not in referenced and self.is_old(post_images, name):
+                yield name
+
+    def delete_original(self, name):
+        # файл могли загрузить заново уже после обхода каталога
+        if (post_images.references(name) or not post_images.exists(name)
+                or not self.is_old(post_images, name)):
+            return
+        delete_thumbnails(name, (default_storage, post_images))
+        post_images.delete(name)
+
+    def delete_source(self, image_file):
+        if not post_images.references(image_file.name):
+            default.kvstore.delete(image_file)
+
+    def scan_kvstore(self, referenced):
+        """Записи sorl об исходниках без ссылок и имена всех миниатюр."""
+        kvstore = default.kvstore
+        sources, thumbnails = [], set()
+        for key in kvstore._find_keys(identity='image'):
+            image_file = kvstore._get(key)
+            if image_file is None:
+                continue
+            if image_file.name.startswith(sorl_settings.THUMBNAIL_PREFIX):
+                thumbnails.add(image_file.name)
+            elif image_file.name not in referenced:
+                sources.append(image_file)
+        return sources, thumbnails
+
+    def orphan_thumbnails(self, thumbnails):
+        storage = default.storage
+        prefix = sorl_settings.THUMBNAIL_PREFIX.rstrip('/')
+        for name in walk(storage, prefix):
+            if name not in thumbnails and self.is_old(storage, name):
+                yield name
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        self.max_batches = options['max_batches']
+        self.dry_run = options['dry_run']
+        self.cutoff = timezone.now() - timedelta(seconds=options['grace'])
+        referenced = set(
+            Post.objects.exclude(image='').exclude(image=None).values_list(
+                'image', flat=True).iterator())
+        self.sweep(
+            'Картинок без записей', self.orphan_originals(referenced),
+            self.delete_original)
+        sources, thumbnails = self.scan_kvstore(referenced)
+        self.sweep(
+            'Записей sorl без картинок', iter(sources), self.delete_source)
+        self.sweep(
+            'Миниатюр без записей sorl', self.orphan_thumbnails(thumbnails),
+            default.storage.delete)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import User
+from posts.stats import reconcile_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики записей и подписок пользователей'
+
+    def handle(self, *args, **options):
+        fixed = 0
+        user_ids = User.objects.values_list('pk', flat=True)
+        for user_id in user_ids.iterator():
+            if reconcile_stats(user_id):
+                fixed += 1
+        self.stdout.write(f'Исправлено расхождений: {fixed}')
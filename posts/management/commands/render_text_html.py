@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Comment, Post, render_text
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Заполняет готовый HTML текста записей и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать HTML и там, где он уже заполнен')
+
+    def render(self, model, everything):
+        objects = model.objects.order_by('pk').only('pk', 'text')
+        if not everything:
+            objects = objects.filter(text_html='')
+        updated, batch = 0, []
+        for obj in objects.iterator(chunk_size=BATCH_SIZE):
+            obj.text_html = render_text(obj.text)
+            batch.append(obj)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, ['text_html'])
+                updated, batch = updated + len(batch), []
+        model.objects.bulk_update(batch, ['text_html'])
+        return updated + len(batch)
+
+    def handle(self, *args, **options):
+        posts = self.render(Post, options['all'])
+        comments = self.render(Comment, options['all'])
+        self.stdout.write(
+            f'Обновлено записей: {posts}, комментариев: {comments}')
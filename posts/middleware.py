@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import (get_conditional_response,
+                                patch_vary_headers)
+from django.utils.encoding import iri_to_uri
+from django.utils.http import http_date, quote_etag
+
+from .cache import LOCK_KEY, LOCK_TIMEOUT, tag_versions
+from .conditional import page_etag, page_last_modified
+from .holes import fill_holes
+
+PAGE_KEY = 'posts:page:{}'
+PAGE_TIMEOUT = 60 * 10
+CACHED_VIEWS = {
+    'posts:index', 'posts:group_posts', 'posts:profile', 'posts:post'}
+
+
+class PageCacheMiddleware:
+    """Кеш страниц ленты, групп, профилей и записей.
+
+    В кеше лежит общий для всех скелет страницы (posts.holes.render_page)
+    и, если страницу строил гость, готовое сжатое gzip тело для гостей.
+    Представление сообщает теги страницы через posts.cache.tag_page(), и
+    сигналы моделей сбрасывают ровно те страницы, на которых видны
+    изменения. Пока сброшенная страница пересчитывается, остальные
+    запросы получают прежнюю копию; если пересчёт не дал страницы для
+    кеша (запись удалена, ошибка), прежняя копия удаляется.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        key = self.cache_key(request)
+        if key is None:
+            return self.get_response(request)
+        entry = cache.get(key)
+        if entry is not None and self.can_serve(entry):
+            versions = entry['versions']
+            if tag_versions(versions, cache) == versions or not cache.add(
+                    LOCK_KEY.format(key), True, LOCK_TIMEOUT):
+                return self.conditional_response(request, entry)
+            request.page_cache_lock = LOCK_KEY.format(key)
+        request.page_cache_key = key
+        try:
+            response = self.get_response(request)
+            self.store(request, response)
+        finally:
+            if hasattr(request, 'page_cache_lock'):
+                cache.delete(request.page_cache_lock)
+        return response
+
+    def accepts(self, request):
+        raise NotImplementedError
+
+    def can_serve(self, entry):
+        return True
+
+    def cache_key(self, request):
+        if (request.method not in ('GET', 'HEAD')
+                or hasattr(request, 'page_cache_key')
+                or not self.accepts(request)):
+            return None
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None
+        if match.view_name not in CACHED_VIEWS:
+            return None
+        url = iri_to_uri(request.get_full_path())
+        return PAGE_KEY.format(hashlib.md5(url.encode()).hexdigest())
+
+    def store(self, request, response):
+        versions = getattr(request, 'page_cache_versions', None)
+        skeleton = getattr(request, 'page_skeleton', None)
+        if (versions is None or skeleton is None or request.method != 'GET'
+                or response.status_code != 200 or response.cookies):
+            if (response.status_code != 200
+                    or hasattr(request, 'page_cache_lock')):
+                cache.delete(request.page_cache_key)
+            return
+        cache.set(request.page_cache_key, {
+            'versions': versions,
+            'content_type': response['Content-Type'],
+            'skeleton': gzip.compress(skeleton.encode()),
+            'anonymous': self.anonymous_copy(request, response),
+        }, PAGE_TIMEOUT)
+
+    def anonymous_copy(self, request, response):
+        return None
+
+    def cached_response(self, request, entry):
+        raise NotImplementedError
+
+    def conditional_response(self, request, entry):
+        response = self.cached_response(request, entry)
+        etag = quote_etag(page_etag(request, entry['versions']))
+        if response.has_header('Content-Encoding'):
+            etag = 'W/' + etag
+        last_modified = int(
+            page_last_modified(entry['versions']).timestamp())
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return get_conditional_response(
+            request, etag=etag, last_modified=last_modified,
+            response=response)
+
+
+class AnonymousPageCacheMiddleware(PageCacheMiddleware):
+    """Отдаёт гостям готовые страницы до сессий и аутентификации.
+
+    Гость определяется по отсутствию cookie сессии, поэтому попадание
+    в кеш обходится без сессии, представления и ORM. Ставится сразу
+    после SecurityMiddleware.
+    """
+
+    def accepts(self, request):
+        return settings.SESSION_COOKIE_NAME not in request.COOKIES
+
+    def can_serve(self, entry):
+        return entry['anonymous'] is not None
+
+    def anonymous_copy(self, request, response):
+        headers = [
+            (name, value) for name, value in response.items()
+            if name.lower() != 'content-length']
+        return headers, gzip.compress(response.content)
+
+    def cached_response(self, request, entry):
+        headers, body = entry['anonymous']
+        accepts_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if not accepts_gzip:
+            body = gzip.decompress(body)
+        response = HttpResponse(
+            b'' if request.method == 'HEAD' else body)
+        for name, value in headers:
+            response[name] = value
+        if accepts_gzip:
+            response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = len(body)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+
+class AuthenticatedPageCacheMiddleware(PageCacheMiddleware):
+    """Собирает страницу из общего скелета для пользователя с сессией.
+
+    Представление не вызывается: в скелет подставляются только дырки
+    (меню, кнопки редактирования и подписки, форма комментария).
+    Ставится после AuthenticationMiddleware.
+    """
+
+    def accepts(self, request):
+        return True
+
+    def cached_response(self, request, entry):
+        skeleton = gzip.decompress(entry['skeleton']).decode()
+        content = fill_holes(request, skeleton)
+        return HttpResponse(
+            '' if request.method == 'HEAD' else content,
+            content_type=entry['content_type'])
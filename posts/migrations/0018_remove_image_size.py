@@ -0,0 +1,21 @@
+# Generated by Django 2.2.6 on 2026-10-17 07:43
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='post',
+            name='image_height',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='image_width',
+        ),
+    ]
@@ -2,10 +2,33 @@ from textwrap import shorten
 
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.template.defaultfilters import linebreaksbr
+from django.utils.safestring import mark_safe
+
+from .storage import post_images
 
 User = get_user_model()
 
 
+def render_text(text):
+    """HTML текста записи или комментария: как фильтр |linebreaksbr."""
+    return str(linebreaksbr(text, autoescape=True))
+
+
+class RenderedTextMixin:
+    """Хранит готовый HTML поля text в text_html."""
+
+    def save(self, *args, **kwargs):
+        self.text_html = render_text(self.text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'text' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'text_html'}
+        super().save(*args, **kwargs)
+
+    def get_text_html(self):
+        return mark_safe(self.text_html or render_text(self.text))
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -18,11 +41,25 @@ class Group(models.Model):
         ordering = ('title',)
 
 
-class Post(models.Model):
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        comment_count = Comment.objects.filter(
+            post=models.OuterRef('pk')
+        ).order_by().values('post').annotate(
+            count=models.Count('pk')
+        ).values('count')
+        return self.select_related('author', 'group').annotate(
+            comment_count=models.Subquery(
+                comment_count, output_field=models.IntegerField())
+        )
+
+
+class Post(RenderedTextMixin, models.Model):
     text = models.TextField(
         verbose_name='Текст записи',
         help_text='Чем бы вы хотели поделиться с миром?'
     )
+    text_html = models.TextField(blank=True, editable=False)
     pub_date = models.DateTimeField('date published', auto_now_add=True)
     author = models.ForeignKey(
         User,
@@ -40,20 +77,36 @@ class Post(models.Model):
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=post_images,
+        db_index=True,
         blank=True,
         null=True,
         verbose_name='Изображение',
         help_text='Если есть что показать, выкладывай!'
     )
+    image_placeholder = models.TextField(blank=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self) -> str:
         return shorten(self.text, width=15)
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'),
+        ]
 
 
-class Comment(models.Model):
+class Comment(RenderedTextMixin, models.Model):
     created = models.DateTimeField('date published', auto_now_add=True)
     post = models.ForeignKey(
         Post,
@@ -69,6 +122,15 @@ class Comment(models.Model):
         verbose_name='Текст комментария',
         help_text='Добавьте комментарий'
     )
+    text_html = models.TextField(blank=True, editable=False)
+
+    class Meta:
+        ordering = ('created',)
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -84,8 +146,57 @@ class Follow(models.Model):
     )
 
     class Meta:
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['user', 'author'],
                 name='unique_follow')
         ]
+
+
+class FeedItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_items'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-pub_date', '-post_id')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_item')
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
@@ -0,0 +1,254 @@
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from django.db.models import F, Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+PER_PAGE = 10
+COUNT_TIMEOUT = 60 * 15
+COUNT_KEY = 'posts:count:{}'
+CURSOR_SALT = 'posts.pagination.cursor'
+NEXT = 'n'
+PREVIOUS = 'p'
+END = 'e'
+ELLIPSIS = '…'
+ON_EACH_SIDE = 2
+ON_ENDS = 1
+MAX_SKIP = ON_EACH_SIDE + ON_ENDS
+MAX_OFFSET_PAGE = (ON_EACH_SIDE + ON_ENDS) * 2
+
+
+def encode_cursor(obj, number, direction, skip=0):
+    anchor = (None, None)
+    if obj is not None:
+        anchor = (obj.pub_date.isoformat(), obj.pk)
+    return signing.dumps(
+        (*anchor, number, direction, skip),
+        salt=CURSOR_SALT,
+        compress=True
+    )
+
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        pub_date, pk, number, direction, skip = signing.loads(
+            value, salt=CURSOR_SALT)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    if (not isinstance(number, int) or not isinstance(skip, int)
+            or not 0 <= skip <= MAX_SKIP):
+        return None
+    if direction == END:
+        return None, None, number, END, skip
+    pub_date = parse_datetime(str(pub_date))
+    if (pub_date is None or direction not in (NEXT, PREVIOUS)
+            or not isinstance(pk, int)):
+        return None
+    return pub_date, pk, max(number, 1), direction, skip
+
+
+def cached_count(scope, queryset):
+    """Количество объектов выборки из кеша; COUNT(*) только при промахе."""
+    key = COUNT_KEY.format(scope)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.values('pk').count()
+        cache.set(key, count, COUNT_TIMEOUT)
+    return count
+
+
+def adjust_counts(scopes, delta):
+    for scope in scopes:
+        try:
+            cache.incr(COUNT_KEY.format(scope), delta)
+        except ValueError:
+            pass
+
+
+def forget_counts(scopes):
+    cache.delete_many([COUNT_KEY.format(scope) for scope in scopes])
+
+
+def elided_page_range(paginator, number, on_each_side=ON_EACH_SIDE,
+                      on_ends=ON_ENDS):
+    """Номера страниц: края и окно вокруг текущей, пропуски — ELLIPSIS."""
+    num_pages = paginator.num_pages
+    if num_pages <= (on_each_side + on_ends) * 2:
+        return list(paginator.page_range)
+    page_range = []
+    if number > 1 + on_each_side + on_ends + 1:
+        page_range.extend(range(1, on_ends + 1))
+        page_range.append(ELLIPSIS)
+        page_range.extend(range(number - on_each_side, number + 1))
+    else:
+        page_range.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends - 1:
+        page_range.extend(range(number + 1, number + on_each_side + 1))
+        page_range.append(ELLIPSIS)
+        page_range.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        page_range.extend(range(number + 1, num_pages + 1))
+    return page_range
+
+
+def make_paginator(object_list, per_page, count_scope=None):
+    paginator = Paginator(object_list, per_page)
+    if count_scope is not None:
+        paginator.count = cached_count(count_scope, object_list)
+    return paginator
+
+
+def get_page(request, object_list, count_scope=None, per_page=PER_PAGE):
+    paginator = make_paginator(object_list, per_page, count_scope)
+    page = paginator.get_page(request.GET.get('page'))
+    page.page_range = elided_page_range(paginator, page.number)
+    page.page_links = [
+        (number, None if number in (ELLIPSIS, page.number)
+         else f'?page={number}')
+        for number in page.page_range]
+    return page
+
+
+class CursorPage(Page):
+    """Страница, открытая по курсору.
+
+    Номер страницы по курсору приблизителен (записи добавляются
+    и удаляются), поэтому наличие соседних страниц определяется
+    по самой выборке, а не по номеру.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next,
+                 has_previous):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+def end_page(paginator, queryset, ordering, skip, per_page):
+    """Страница skip-я с конца: выборка идёт от самой старой записи."""
+    num_pages = paginator.num_pages
+    skip = min(skip, num_pages - 1)
+    last_size = paginator.count - (num_pages - 1) * per_page
+    start = 0 if skip == 0 else last_size + (skip - 1) * per_page
+    size = last_size if skip == 0 else per_page
+    object_list = list(queryset.order_by(*ordering)[start:start + size])
+    object_list.reverse()
+    number = num_pages - skip
+    return CursorPage(object_list, number, paginator, skip > 0, number > 1)
+
+
+def seek_page(paginator, queryset, cursor, fields, per_page, filters):
+    """Страница после (NEXT) или перед (PREVIOUS) записью курсора.
+
+    Пропускается не больше skip страниц, поэтому OFFSET ограничен.
+    """
+    pub_date, pk, number, direction, skip = cursor
+    date_field, pk_field = fields
+    if direction == NEXT:
+        seek = (Q(**{date_field + '__lt': pub_date})
+                | Q(**{date_field: pub_date, pk_field + '__lt': pk}))
+        ordering = (F(date_field).desc(), F(pk_field).desc())
+    else:
+        seek = (Q(**{date_field + '__gt': pub_date})
+                | Q(**{date_field: pub_date, pk_field + '__gt': pk}))
+        ordering = (F(date_field).asc(), F(pk_field).asc())
+    start = skip * per_page
+    object_list = list(queryset.filter(seek, **filters).order_by(
+        *ordering)[start:start + per_page + 1])
+    more = len(object_list) > per_page
+    object_list = object_list[:per_page]
+    if not object_list:
+        return paginator.page(1)
+    number = min(max(number, 2), paginator.num_pages)
+    if direction == PREVIOUS:
+        object_list.reverse()
+        return CursorPage(object_list, number if more else 1, paginator,
+                          True, more)
+    return CursorPage(object_list, number if more else paginator.num_pages,
+                      paginator, more, True)
+
+
+def numbered_page(paginator, value, end):
+    """Страница по ?page=: OFFSET только для первых страниц.
+
+    Последние страницы отдаются от конца выборки, а глубже первых
+    MAX_OFFSET_PAGE страниц без курсора не пускают.
+    """
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        number = 1
+    number = min(max(number, 1), paginator.num_pages)
+    if number <= MAX_OFFSET_PAGE:
+        return paginator.page(number)
+    skip = paginator.num_pages - number
+    if skip <= MAX_SKIP:
+        return end(skip)
+    raise Http404
+
+
+def cursor_link(page, number):
+    """Адрес страницы number из окна пагинатора текущей страницы."""
+    shift = number - page.number
+    if page.object_list and 0 < shift <= ON_EACH_SIDE:
+        cursor = encode_cursor(page[len(page) - 1], number, NEXT, shift - 1)
+    elif page.object_list and -ON_EACH_SIDE <= shift < 0:
+        cursor = encode_cursor(page[0], number, PREVIOUS, -shift - 1)
+    elif page.paginator.num_pages - number <= MAX_SKIP:
+        cursor = encode_cursor(
+            None, number, END, page.paginator.num_pages - number)
+    else:
+        return f'?page={number}'
+    return f'?cursor={cursor}'
+
+
+def get_cursor_page(request, queryset, count_scope=None,
+                    date_field='pub_date', pk_field='pk', per_page=PER_PAGE,
+                    **filters):
+    """Страница записей с навигацией по ключу (date_field, pk_field).
+
+    Переход по ?cursor= не использует OFFSET: выборка продолжается
+    от последней показанной записи. Номера в окне пагинатора и последние
+    страницы тоже открываются по курсору. Фильтры передаются отдельно,
+    чтобы условие курсора попало в тот же JOIN, что и они.
+    """
+    ordering = (F(date_field).desc(), F(pk_field).desc())
+    paginator = make_paginator(
+        queryset.filter(**filters).order_by(*ordering), per_page, count_scope)
+
+    def end(skip):
+        return end_page(
+            paginator, queryset.filter(**filters),
+            (F(date_field).asc(), F(pk_field).asc()), skip, per_page)
+
+    cursor = decode_cursor(request.GET.get('cursor'))
+    if cursor is None:
+        page = numbered_page(paginator, request.GET.get('page'), end)
+    elif cursor[3] == END:
+        page = end(cursor[4])
+    else:
+        page = seek_page(paginator, queryset, cursor, (date_field, pk_field),
+                         per_page, filters)
+    page.page_range = elided_page_range(paginator, page.number)
+    page.page_links = [
+        (number, None if number in (ELLIPSIS, page.number)
+         else cursor_link(page, number))
+        for number in page.page_range]
+    page.next_cursor = page.previous_cursor = None
+    if page.object_list:
+        if page.has_next():
+            page.next_cursor = encode_cursor(
+                page[len(page) - 1], page.number + 1, NEXT)
+        if page.has_previous():
+            page.previous_cursor = encode_cursor(
+                page[0], page.number - 1, PREVIOUS)
+    return page
@@ -0,0 +1,121 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .cache import invalidate, post_cache_tags
+from .feed import (authors_follower_ids, backfill_feed, fan_out_post,
+                   follower_ids, forget_feed_counts, invalidate_feeds,
+                   trim_feed)
+from .models import Comment, Follow, Group, Post
+from .pagination import adjust_counts, forget_counts
+from .stats import bump_stats, follow_changed
+from .thumbnails import schedule_thumbnails
+
+
+def post_count_scopes(post):
+    scopes = ['posts', f'author:{post.author_id}']
+    if post.group_id is not None:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
+
+
+def group_author_ids(group):
+    return list(group.posts.order_by().values_list(
+        'author_id', flat=True).distinct())
+
+
+def invalidate_group(group_id, author_ids):
+    """Сбрасывает ленту, страницу группы и страницы её авторов."""
+    invalidate('feed', f'group:{group_id}',
+               *(f'author:{author_id}' for author_id in author_ids))
+    invalidate_feeds(authors_follower_ids(author_ids))
+
+
+def follow_cache_tags(follow):
+    return [f'stats:{follow.author_id}', f'stats:{follow.user_id}']
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    old = Post.objects.filter(pk=instance.pk).values_list(
+        'group_id', 'image').first()
+    if old is None:
+        return
+    old_group_id, instance._old_image = old
+    if old_group_id != instance.group_id:
+        instance._old_group_id = old_group_id
+        group_ids = {old_group_id, instance.group_id} - {None}
+        forget_counts(f'group:{group_id}' for group_id in group_ids)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    invalidate(*post_cache_tags(instance))
+    if created:
+        bump_stats(instance.author_id, posts_count=1)
+        adjust_counts(post_count_scopes(instance), 1)
+        fan_out_post(instance)
+    else:
+        invalidate_feeds(follower_ids(instance.author_id))
+    image = instance.image.name
+    if image and image != getattr(instance, '_old_image', None):
+        schedule_thumbnails(image, instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    invalidate(*post_cache_tags(instance))
+    bump_stats(instance.author_id, posts_count=-1)
+    adjust_counts(post_count_scopes(instance), -1)
+    followers = follower_ids(instance.author_id)
+    forget_feed_counts(followers)
+    invalidate_feeds(followers)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    try:
+        post = instance.post
+    except Post.DoesNotExist:
+        return
+    invalidate(*post_cache_tags(post))
+    invalidate_feeds(follower_ids(post.author_id))
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        invalidate('feed', f'group:{instance.pk}')
+        adjust_counts(['groups'], 1)
+    else:
+        invalidate_group(instance.pk, group_author_ids(instance))
+
+
+@receiver(pre_delete, sender=Group)
+def group_deleting(sender, instance, **kwargs):
+    # к post_delete SET_NULL уже отвязал записи от группы
+    instance._author_ids = group_author_ids(instance)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    invalidate_group(instance.pk, getattr(instance, '_author_ids', ()))
+    adjust_counts(['groups'], -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        follow_changed(instance, 1)
+        invalidate(*follow_cache_tags(instance))
+        backfill_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follow_changed(instance, -1)
+    invalidate(*follow_cache_tags(instance))
+    trim_feed(instance.user_id, instance.author_id)
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models import F
+
+from .cache import invalidate
+from .models import Follow, Post, UserStats
+
+
+def count_stats(user_id):
+    return {
+        'posts_count': Post.objects.filter(author_id=user_id).count(),
+        'followers_count': Follow.objects.filter(author_id=user_id).count(),
+        'following_count': Follow.objects.filter(user_id=user_id).count(),
+    }
+
+
+def get_stats(user):
+    """Счётчики пользователя; при первом обращении считаются по базе."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(
+            user=user, defaults=count_stats(user.pk))
+        return stats
+
+
+def bump_stats(user_id, **deltas):
+    """Атомарно сдвигает счётчики, если запись уже заведена."""
+    UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def reconcile_stats(user_id):
+    """Пересчитывает счётчики; возвращает True, если они расходились."""
+    actual = count_stats(user_id)
+    stats, created = UserStats.objects.get_or_create(
+        user_id=user_id, defaults=actual)
+    if created:
+        return False
+    if all(getattr(stats, field) == value for field, value in actual.items()):
+        return False
+    UserStats.objects.filter(user_id=user_id).update(**actual)
+    invalidate(f'stats:{user_id}')
+    return True
+
+
+def follow_changed(follow, delta):
+    with transaction.atomic():
+        bump_stats(follow.author_id, followers_count=delta)
+        bump_stats(follow.user_id, following_count=delta)
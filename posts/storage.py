@@ -0,0 +1,63 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CONTENT_NAME = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}(\.\w+)?$')
+
+
+def content_name(name, content):
+    """Имя файла по SHA-256 содержимого в каталоге исходного имени."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    digest = digest.hexdigest()
+    directory, basename = posixpath.split(name)
+    extension = os.path.splitext(basename)[1].lower()
+    return posixpath.join(directory, digest[:2], digest + extension)
+
+
+def is_content_name(name):
+    return CONTENT_NAME.search(name) is not None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файлы записей под хешем содержимого: одинаковые загрузки — один файл.
+
+    Повторная загрузка тех же байтов возвращает имя уже сохранённого
+    файла, поэтому общими становятся и миниатюры sorl, привязанные
+    к имени исходника. Ссылки на файл считаются по Post.image: файл
+    удаляется, только когда на него не ссылается ни одна запись.
+    Повторная загрузка обновляет время изменения файла, чтобы gc_media
+    не принял его за давний файл без записей, пока новая запись
+    не сохранена.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = content_name(name, content)
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return super().save(name, content, max_length)
+        return name
+
+    def references(self, name):
+        return apps.get_model('posts', 'Post').objects.filter(
+            image=name).count()
+
+    def delete(self, name):
+        if not self.references(name):
+            super().delete(name)
+
+
+post_images = ContentAddressedStorage()
@@ -0,0 +1,121 @@
+from django import template
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.safestring import mark_safe
+
+from posts.cache import CARD_TIMEOUT, card_key, get_or_build
+from posts.holes import hole_marker, render_hole
+from posts.thumbnails import ready_thumbnails
+
+register = template.Library()
+
+
+class TaggedCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, tags,
+                 cache_name='default'):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.tags = tags
+        self.cache_name = cache_name
+
+    def render(self, context):
+        timeout = int(self.timeout.resolve(context))
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        tags = [tag.resolve(context) for tag in self.tags]
+        cache = caches[self.cache_name]
+        return get_or_build(
+            key, tags, lambda: self.nodelist.render(context), timeout, cache)
+
+
+@register.tag
+def tagged_cache(parser, token):
+    """Кеширует фрагмент до сброса любого из его тегов.
+
+    {% tagged_cache 3600 index_page page.number tags "feed" %}
+        ...
+    {% endtagged_cache %}
+
+    Версии тегов хранятся в том же кеше, что и фрагмент; другой кеш
+    выбирается последним аргументом using="name". Пока один процесс
+    пересчитывает сброшенный фрагмент, остальные отдают прежнюю версию.
+    """
+    nodelist = parser.parse(('endtagged_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    cache_name = 'default'
+    if bits[-1].startswith('using='):
+        cache_name = bits.pop()[len('using='):].strip('"\'')
+    if 'tags' not in bits or len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} requires a timeout, a fragment name and tags')
+    split = bits.index('tags')
+    return TaggedCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:split]],
+        [parser.compile_filter(bit) for bit in bits[split + 1:]],
+        cache_name,
+    )
+
+
+@register.filter
+def cache_tag(name, pk):
+    return f'{name}:{pk}'
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **kwargs):
+    """Часть страницы, своя для каждого пользователя.
+
+    Внутри render_page() выводит метку, которую posts.holes.fill_holes()
+    заменяет на отрисованный шаблон дырки, иначе отрисовывает его сразу.
+    Аргументы должны сериализоваться в JSON.
+    """
+    request = context.get('request')
+    if getattr(request, 'page_holes', False):
+        return hole_marker(name, kwargs)
+    return render_hole(request, name, kwargs)
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Карточки записей; готовый HTML берётся из кеша одним запросом.
+
+    Карточки кешируются только внутри render_page(), где личные части
+    карточки выводятся метками, общими для всех пользователей, и только
+    когда миниатюра уже готова. Миниатюры для карточек, которых нет
+    в кеше, ищутся одним обращением на всю страницу.
+    """
+    template = context.template.engine.get_template('posts/post_item.html')
+    request = context.get('request')
+
+    def render(post):
+        return template.render(context.new({'post': post, 'request': request}))
+
+    def prefetch(posts):
+        if request is not None:
+            request.thumbnails = ready_thumbnails(
+                post.image for post in posts)
+
+    if not getattr(request, 'page_holes', False):
+        posts = list(posts)
+        prefetch(posts)
+        return mark_safe(''.join(render(post) for post in posts))
+    keys = {card_key(post): post for post in posts}
+    cards = cache.get_many(list(keys))
+    prefetch(post for key, post in keys.items() if key not in cards)
+    missing = {}
+    for key, post in keys.items():
+        if key in cards:
+            continue
+        request.thumbnails_pending = False
+        cards[key] = render(post)
+        if not request.thumbnails_pending:
+            missing[key] = cards[key]
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    return mark_safe(''.join(cards[key] for key in keys))
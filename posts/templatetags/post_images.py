@@ -0,0 +1,23 @@
+from django import template
+
+from posts.thumbnails import card_thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def card_image(context, file_):
+    """Варианты картинки карточки, если все они уже созданы, иначе None.
+
+    {% card_image post.image as im %}
+
+    Пока миниатюр нет, запрос помечается request.thumbnails_pending,
+    чтобы карточку с заглушкой не закешировали надолго. Миниатюры,
+    заранее найденные для всей страницы (request.thumbnails), повторно
+    не ищутся.
+    """
+    request = context.get('request')
+    image = card_thumbnails(file_, getattr(request, 'thumbnails', None))
+    if file_ and image is None and request is not None:
+        request.thumbnails_pending = True
+    return image
@@ -0,0 +1,463 @@
+import gzip
+import os
+import runpy
+import shutil
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.conf import settings
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from posts import cache as tagged
+from posts.cache import card_key, get_or_build, invalidate
+from posts.models import Comment, Follow, Group, Post, User
+from yatube.cache_backends import SQLiteCache, TwoTierCache
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = f'{self.directory}/cache.sqlite3'
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_values_are_shared_between_instances(self):
+        """Значение, записанное одним процессом, видно другому"""
+        self.cache.set('key', {'value': 1})
+        other = self.make_cache()
+        self.assertEqual(other.get('key'), {'value': 1})
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expired_values_are_not_returned(self):
+        """Просроченные записи не возвращаются и не мешают add"""
+        self.cache.set('key', 'old', 1)
+        self.cache.touch('key', 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertFalse(self.cache.add('key', 'newer'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr_and_many(self):
+        """incr и пакетные операции"""
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.cache.incr('a', 5), 6)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': 6, 'b': 2})
+        with self.assertRaises(ValueError):
+            self.cache.incr('c')
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """При переполнении вытесняются давно не читанные записи"""
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3)
+        for key in 'abc':
+            cache.set(key, key)
+        cache._db.execute("UPDATE cache SET accessed = 0 WHERE key LIKE '%b'")
+        cache.set('d', 'd')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get_many(['a', 'c', 'd']),
+                         {'a': 'a', 'c': 'c', 'd': 'd'})
+
+    def test_size_cap_is_enforced(self):
+        """Суммарный объём значений не превышает MAX_SIZE"""
+        cache = self.make_cache(MAX_SIZE=2000)
+        for number in range(10):
+            cache.set(f'key{number}', 'x' * 500)
+        _, size = cache._usage(cache._db)
+        self.assertLessEqual(size, 2000)
+        self.assertEqual(cache.get('key9'), 'x' * 500)
+
+    def test_usage_matches_table_contents(self):
+        """Счётчики объёма совпадают с содержимым после любых записей"""
+        cache = self.make_cache(MAX_ENTRIES=5)
+        cache.set_many({f'key{number}': number for number in range(8)})
+        cache.set('key7', 'x' * 100)
+        cache.add('key7', 'ignored')
+        cache.incr('key6', 10 ** 20)
+        cache.delete('key6')
+        self.assertEqual(
+            cache._usage(cache._db),
+            cache._db.execute(
+                'SELECT COUNT(*), SUM(size) FROM cache').fetchone())
+        cache.clear()
+        self.assertEqual(cache._usage(cache._db), (0, 0))
+
+    def test_usage_is_counted_for_existing_files(self):
+        """Для файла без таблицы счётчиков она заполняется при открытии"""
+        location = f'{self.directory}/legacy.sqlite3'
+        with sqlite3.connect(location) as db:
+            db.execute(
+                'CREATE TABLE cache (key TEXT PRIMARY KEY, value BLOB, '
+                'expires REAL, accessed REAL, size INTEGER)')
+            db.executemany(
+                'INSERT INTO cache VALUES (?, ?, NULL, 0, ?)',
+                [('a', b'a', 10), ('b', b'b', 20)])
+        db.close()
+        cache = SQLiteCache(location, {})
+        self.assertEqual(cache._usage(cache._db), (2, 30))
+
+
+class DeploymentSettingsTests(SimpleTestCase):
+    def load_settings(self, **environ):
+        environ = {'PAGE_CACHE': '', 'SHARED_CACHE_DIR': '', **environ}
+        with mock.patch.dict(os.environ, environ):
+            return runpy.run_path(
+                os.path.join(settings.BASE_DIR, 'yatube', 'settings.py'))
+
+    def test_caches_are_enabled_by_environment(self):
+        """Общий кеш и кеш страниц включаются переменными окружения"""
+        local = self.load_settings()
+        self.assertNotIn('posts.middleware.AnonymousPageCacheMiddleware',
+                         local['MIDDLEWARE'])
+        self.assertEqual(local['CACHES']['default']['BACKEND'],
+                         'django.core.cache.backends.locmem.LocMemCache')
+        deployed = self.load_settings(
+            PAGE_CACHE='1', SHARED_CACHE_DIR='/var/cache/yatube')
+        middleware = deployed['MIDDLEWARE']
+        self.assertEqual(
+            middleware[1], 'posts.middleware.AnonymousPageCacheMiddleware')
+        self.assertEqual(
+            middleware.index(
+                'posts.middleware.AuthenticatedPageCacheMiddleware'),
+            middleware.index('django.contrib.auth.middleware.'
+                             'AuthenticationMiddleware') + 1)
+        caches = deployed['CACHES']
+        self.assertEqual(caches['default']['BACKEND'],
+                         'yatube.cache_backends.TwoTierCache')
+        self.assertEqual(caches['feeds']['LOCATION'],
+                         '/var/cache/yatube/feeds.sqlite3')
+
+
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.shared = caches['feeds']
+        self.shared.clear()
+        self.worker = self.make_worker()
+        self.other = self.make_worker()
+
+    def tearDown(self):
+        self.shared.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_worker(self, **options):
+        return TwoTierCache(
+            f'{self.directory}/journal',
+            {'OPTIONS': {'L2': 'feeds', **options}})
+
+    def test_hot_keys_are_served_from_local_tier(self):
+        """Повторное чтение не обращается к общему кешу"""
+        self.worker.set('key', 'value')
+        self.assertEqual(self.other.get('key'), 'value')
+        self.shared.set('key', 'changed behind the journal')
+        self.assertEqual(self.other.get('key'), 'value')
+
+    def test_writes_evict_local_entries_in_other_workers(self):
+        """Запись в одном процессе вытесняет ключ из L1 остальных"""
+        self.worker.set('key', 1)
+        self.assertEqual(self.other.get('key'), 1)
+        self.worker.incr('key')
+        self.assertEqual(self.other.get('key'), 2)
+        self.worker.delete('key')
+        self.assertIsNone(self.other.get('key'))
+
+    def test_tag_invalidation_reaches_other_workers(self):
+        """Сброс тега из сигналов виден во всех процессах"""
+        get_or_build('entry', ['feed'], lambda: 'html', 60, self.worker)
+        self.assertEqual(
+            get_or_build('entry', ['feed'], lambda: 'new', 60, self.other),
+            'html')
+        invalidate('feed', cache=self.worker)
+        self.assertEqual(
+            get_or_build('entry', ['feed'], lambda: 'new', 60, self.other),
+            'new')
+
+    def test_local_tier_is_bounded(self):
+        """L1 хранит не больше MAX_ENTRIES записей"""
+        worker = self.make_worker(MAX_ENTRIES=2)
+        self.shared.set_many({'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(worker.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2, 'c': 3})
+        self.assertEqual(len(worker._l1), 2)
+
+    def test_journal_rotation_clears_local_tier(self):
+        """После ротации журнала L1 сбрасывается целиком"""
+        worker = self.make_worker(JOURNAL_LIMIT=1)
+        self.other.set('key', 'value')
+        self.assertEqual(worker.get('key'), 'value')
+        self.shared.set('key', 'new')
+        self.other.set('another', 'value')
+        worker.set('third', 'value')
+        self.assertEqual(worker.get('key'), 'new')
+
+
+class GetOrBuildTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = []
+
+    def build(self, value, duration=0):
+        def build():
+            time.sleep(duration)
+            self.builds.append(value)
+            return value
+        return build
+
+    def test_fresh_value_is_built_once(self):
+        """Свежее значение не пересчитывается"""
+        for value in ('first', 'second'):
+            self.assertEqual(
+                get_or_build('key', ['feed'], self.build(value), 60),
+                'first')
+        self.assertEqual(self.builds, ['first'])
+
+    def test_stale_value_is_served_while_another_worker_rebuilds(self):
+        """Пока идёт пересчёт, остальные получают прежнее значение"""
+        get_or_build('key', ['feed'], self.build('old'), 60)
+        invalidate('feed')
+        cache.add(tagged.LOCK_KEY.format('key'), True)
+        self.assertEqual(
+            get_or_build('key', ['feed'], self.build('new'), 60), 'old')
+        cache.delete(tagged.LOCK_KEY.format('key'))
+        self.assertEqual(
+            get_or_build('key', ['feed'], self.build('new'), 60), 'new')
+        self.assertEqual(self.builds, ['old', 'new'])
+
+    def test_cold_key_waits_for_the_rebuilding_worker(self):
+        """Без старого значения ожидание ограничено, затем пересчёт"""
+        cache.add(tagged.LOCK_KEY.format('key'), True)
+        with mock.patch.object(tagged, 'WAIT_STEPS', 1):
+            self.assertEqual(
+                get_or_build('key', ['feed'], self.build('value'), 60),
+                'value')
+        self.assertTrue(cache.get(tagged.LOCK_KEY.format('key')))
+
+    def test_expensive_value_is_refreshed_early(self):
+        """Дорогое значение обновляется до истечения срока"""
+        get_or_build('key', [], self.build('old', 0.05), 1)
+        with mock.patch.object(tagged.random, 'random',
+                               return_value=1 - 1e-10):
+            self.assertEqual(
+                get_or_build('key', [], self.build('new'), 1), 'new')
+
+
+AUTH_MIDDLEWARE = settings.MIDDLEWARE.index(
+    'django.contrib.auth.middleware.AuthenticationMiddleware') + 1
+
+
+@override_settings(MIDDLEWARE=[
+    settings.MIDDLEWARE[0],
+    'posts.middleware.AnonymousPageCacheMiddleware',
+    *settings.MIDDLEWARE[1:AUTH_MIDDLEWARE],
+    'posts.middleware.AuthenticatedPageCacheMiddleware',
+    *settings.MIDDLEWARE[AUTH_MIDDLEWARE:],
+])
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            text='Первая запись', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.urls = (
+            '/',
+            f'/group/{self.group.slug}/',
+            f'/{self.author.username}/',
+            f'/{self.author.username}/{self.post.pk}/',
+        )
+
+    def assertCached(self, url):
+        with self.assertNumQueries(0):
+            return self.guest_client.get(url)
+
+    def test_guest_pages_skip_the_view_when_cached(self):
+        """Повторный запрос гостя обслуживается без обращения к базе"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                content = self.guest_client.get(url).content
+                response = self.assertCached(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, content)
+
+    def test_cached_pages_answer_not_modified(self):
+        """Страница из кеша тоже отвечает 304 на свой ETag"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_body_is_stored_compressed(self):
+        """Клиенту с gzip отдаётся сжатое тело"""
+        content = self.guest_client.get('/').content
+        response = self.guest_client.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), content)
+
+    def test_authorized_pages_share_the_skeleton(self):
+        """Пользователь с сессией получает общий скелет со своими дырками"""
+        author_client = Client()
+        author_client.force_login(self.author)
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        edit_url = f'/{self.author.username}/{self.post.pk}/edit/'
+        # сессия и пользователь, на профиле и записи ещё проверка подписки
+        queries = dict(zip(self.urls, (2, 2, 3, 3)))
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(author_client.get(url), edit_url)
+                with self.assertNumQueries(queries[url]):
+                    response = reader_client.get(url)
+                self.assertNotContains(response, edit_url)
+                self.assertContains(response, self.reader.username)
+                self.assertNotContains(self.guest_client.get(url),
+                                       self.reader.username)
+
+    def test_follow_button_is_personal(self):
+        """Кнопка подписки отражает подписку текущего пользователя"""
+        Follow.objects.create(user=self.reader, author=self.author)
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        url = self.urls[2]
+        self.guest_client.get(url)
+        self.assertContains(reader_client.get(url), 'Отписаться')
+        self.assertContains(self.guest_client.get(url), 'Подписаться')
+
+    def rename_group(self):
+        self.group.title = 'Переименована'
+        self.group.save()
+
+    def test_changes_purge_dependent_pages(self):
+        """Изменения записей, комментариев, групп и подписок сбрасывают
+        страницы, на которых они видны"""
+        index, group, profile, post = self.urls
+        counter = '<span style="color:red">{}</span>'
+        changes = (
+            (lambda: Post.objects.create(
+                text='Новая запись', author=self.author, group=self.group),
+             {index: 'Новая запись', group: 'Новая запись',
+              profile: 'Новая запись', post: counter.format(2)}),
+            (lambda: Comment.objects.create(
+                post=self.post, author=self.reader, text='Комментарий'),
+             {post: 'Комментарий'}),
+            (self.rename_group, {group: 'Переименована'}),
+            (lambda: Follow.objects.create(
+                user=self.reader, author=self.author),
+             {profile: counter.format(1), post: counter.format(1)}),
+        )
+        for change, expected in changes:
+            for url in self.urls:
+                self.guest_client.get(url)
+            change()
+            for url, text in expected.items():
+                with self.subTest(url=url, text=text):
+                    self.assertContains(self.guest_client.get(url), text)
+
+    def test_group_changes_reach_author_pages(self):
+        """Переименование и удаление группы видны в профиле автора"""
+        profile = self.urls[2]
+        self.guest_client.get(profile)
+        self.rename_group()
+        self.assertContains(self.guest_client.get(profile), 'Переименована')
+        self.group.delete()
+        self.assertNotContains(self.guest_client.get(profile),
+                               f'/group/{self.group.slug}/')
+
+    def test_failed_rebuild_drops_stale_page(self):
+        """Удалённая запись не отдаётся из кеша и во время пересчёта"""
+        url = self.urls[3]
+        self.guest_client.get(url)
+        Post.objects.filter(pk=self.post.pk).delete()
+        self.assertEqual(self.guest_client.get(url).status_code, 404)
+        key = self.guest_client.get(url).wsgi_request.page_cache_key
+        cache.add(tagged.LOCK_KEY.format(key), True)
+        self.assertEqual(self.guest_client.get(url).status_code, 404)
+
+    def test_unrelated_pages_stay_cached(self):
+        """Комментарий не сбрасывает чужие профили"""
+        other = User.objects.create_user(username='other')
+        url = f'/{other.username}/'
+        self.guest_client.get(url)
+        Comment.objects.create(post=self.post, author=self.reader,
+                               text='Комментарий')
+        self.assertCached(url)
+
+
+class PageHolesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='Запись', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_fragments_do_not_leak_personal_parts(self):
+        """Закешированный фрагмент ленты не несёт кнопок другого
+        пользователя"""
+        edit_url = f'/{self.author.username}/{self.post.pk}/edit/'
+        author_client = Client()
+        author_client.force_login(self.author)
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        self.assertContains(author_client.get('/'), edit_url)
+        self.assertNotContains(reader_client.get('/'), edit_url)
+        self.assertNotContains(reader_client.get('/'), '<!--hole:')
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            text='Запись', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+
+    def listed_post(self):
+        return Post.objects.for_listing().get(pk=self.post.pk)
+
+    def test_card_is_reused_across_listings(self):
+        """Карточка, отрисованная на главной, берётся из кеша в группе"""
+        self.client.get('/')
+        key = card_key(self.listed_post())
+        self.assertIn('Запись', cache.get(key))
+        cache.set(key, 'Карточка из кеша')
+        self.assertContains(
+            self.client.get(f'/group/{self.group.slug}/'),
+            'Карточка из кеша')
+
+    def test_card_key_follows_post_version(self):
+        """Правка, комментарий и смена картинки меняют ключ карточки"""
+        keys = {card_key(self.listed_post())}
+        changes = (
+            lambda post: setattr(post, 'text', 'Правка'),
+            lambda post: Comment.objects.create(
+                post=post, author=self.author, text='Комментарий'),
+            lambda post: setattr(post, 'image', 'posts/other.gif'),
+        )
+        for change in changes:
+            post = self.listed_post()
+            change(post)
+            post.save()
+            keys.add(card_key(self.listed_post()))
+        self.assertEqual(len(keys), len(changes) + 1)
@@ -1,12 +1,16 @@
 import os
 import shutil
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from posts.models import Group, Post, User
+from posts.storage import content_name
 
 
 @override_settings(MEDIA_ROOT=os.path.join(settings.BASE_DIR, 'temp_media'))
@@ -78,13 +82,11 @@ class PostFormTests(TestCase):
         )
         self.assertRedirects(response, reverse('posts:index'))
         self.assertEqual(Post.objects.count(), posts_count + 1)
-        self.assertTrue(
-            Post.objects.filter(
-                text=form_data['text'],
-                group=PostFormTests.group.id,
-                image='posts/small_2.gif',
-            ).exists()
-        )
+        post = Post.objects.get(
+            text=form_data['text'], group=PostFormTests.group.id)
+        self.assertEqual(
+            post.image.name,
+            content_name('posts/small_2.gif', post.image.file))
 
     def test_post_works_with_database(self):
         """Редактирование поста через форму изменяет запись в БД"""
@@ -119,3 +121,60 @@ class PostFormTests(TestCase):
             response.context.get('post').text,
             form_data['text']
         )
+
+    def upload_jpeg(self, size, **save_options):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', **save_options)
+        return SimpleUploadedFile(
+            name='photo.jpg',
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+
+    @override_settings(IMAGE_MAX_SIDE=64)
+    def test_upload_is_downscaled_without_metadata(self):
+        """Загрузка уменьшается, теряет EXIF, заглушка сохраняется в записи"""
+        exif = Image.Exif()
+        exif[0x010F] = 'Камера'
+        self.authorized_client.post(
+            reverse('posts:new_post'),
+            data={'text': 'Фото', 'image': self.upload_jpeg(
+                (400, 200), exif=exif.tobytes())},
+        )
+        post = Post.objects.get(text='Фото')
+        self.assertTrue(
+            post.image_placeholder.startswith('data:image/jpeg;base64,'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (64, 32))
+            self.assertNotIn('exif', image.info)
+
+    def test_other_formats_are_stored_as_png(self):
+        """BMP и другие форматы Pillow сохраняются как PNG"""
+        buffer = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(buffer, 'BMP')
+        self.authorized_client.post(
+            reverse('posts:new_post'),
+            data={'text': 'Фото', 'image': SimpleUploadedFile(
+                'photo.bmp', buffer.getvalue(), 'image/bmp')},
+        )
+        post = Post.objects.get(text='Фото')
+        self.assertTrue(post.image.name.endswith('.png'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'PNG')
+            self.assertEqual(image.size, (40, 20))
+
+    @override_settings(IMAGE_MAX_PIXELS=100)
+    def test_oversized_image_is_rejected(self):
+        """Слишком большая картинка отклоняется до декодирования"""
+        posts_count = Post.objects.count()
+        image = self.upload_jpeg((20, 20))
+        with mock.patch.object(Image.Image, 'load') as load:
+            response = self.authorized_client.post(
+                reverse('posts:new_post'),
+                data={'text': 'Фото', 'image': image},
+            )
+        load.assert_not_called()
+        self.assertFormError(
+            response, 'form', 'image',
+            'Изображение слишком большое: 20×20.')
+        self.assertEqual(Post.objects.count(), posts_count)
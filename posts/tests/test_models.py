@@ -1,6 +1,19 @@
-from django.test import TestCase
+import os
+import shutil
+from io import StringIO
 
-from posts.models import Group, Post, User
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default as sorl_default
+
+from posts.models import (Comment, FeedItem, Follow, Group, Post, User,
+                          UserStats)
+from posts.stats import get_stats
+from posts import thumbnails
+from posts.storage import is_content_name, post_images
 
 
 class PostModelTest(TestCase):
@@ -53,3 +66,213 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         expected_object_name = group.title
         self.assertEquals(expected_object_name, str(group))
+
+
+class FeedItemModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='IvanovII')
+        cls.reader = User.objects.create_user(username='PetrovPP')
+        cls.old_post = Post.objects.create(
+            text='Старая запись',
+            author=cls.author,
+        )
+
+    def test_follow_backfills_feed(self):
+        """Подписка добавляет в ленту уже опубликованные записи автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertTrue(
+            FeedItem.objects.filter(
+                user=self.reader, post=self.old_post).exists()
+        )
+
+    def test_new_post_fans_out_to_followers(self):
+        """Новая запись попадает в ленты подписчиков автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        new_post = Post.objects.create(
+            text='Новая запись',
+            author=self.author,
+        )
+        item = FeedItem.objects.get(user=self.reader, post=new_post)
+        self.assertEqual(item.pub_date, new_post.pub_date)
+        self.assertFalse(
+            FeedItem.objects.filter(user=self.author).exists()
+        )
+
+    def test_unfollow_trims_feed(self):
+        """Отписка убирает записи автора из ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.filter(user=self.reader, author=self.author).delete()
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+
+
+class UserStatsModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='IvanovII')
+        cls.reader = User.objects.create_user(username='PetrovPP')
+        get_stats(cls.author)
+        get_stats(cls.reader)
+
+    def test_counters_follow_posts_and_subscriptions(self):
+        """Счётчики меняются вместе с записями и подписками."""
+        post = Post.objects.create(text='Тестовый текст', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        author_stats = UserStats.objects.get(user=self.author)
+        reader_stats = UserStats.objects.get(user=self.reader)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(reader_stats.following_count, 1)
+        post.delete()
+        Follow.objects.filter(user=self.reader).delete()
+        author_stats.refresh_from_db()
+        reader_stats.refresh_from_db()
+        self.assertEqual(author_stats.posts_count, 0)
+        self.assertEqual(author_stats.followers_count, 0)
+        self.assertEqual(reader_stats.following_count, 0)
+
+    def test_reconcile_command_fixes_drift(self):
+        """Команда reconcile_stats исправляет разошедшиеся счётчики."""
+        Post.objects.create(text='Тестовый текст', author=self.author)
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        call_command('reconcile_stats', stdout=StringIO())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+
+
+class RenderedTextModelTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+
+    def test_text_html_is_rendered_on_save(self):
+        """При сохранении текст записи и комментария переводится в HTML."""
+        post = Post.objects.create(
+            text='<b>Первая</b>\nвторая', author=self.author)
+        comment = Comment.objects.create(
+            post=post, author=self.author, text='а & б')
+        self.assertEqual(
+            post.text_html, '&lt;b&gt;Первая&lt;/b&gt;<br>вторая')
+        self.assertEqual(comment.text_html, 'а &amp; б')
+        post.text = 'Правка'
+        post.save(update_fields=['text'])
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, 'Правка')
+
+    def test_render_command_fills_missing_html(self):
+        """Команда render_text_html заполняет пустой HTML."""
+        post = Post.objects.create(text='Текст\nзаписи', author=self.author)
+        Post.objects.filter(pk=post.pk).update(text_html='')
+        self.assertEqual(post.get_text_html(), 'Текст<br>записи')
+        call_command('render_text_html', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.text_html, 'Текст<br>записи')
+
+
+@override_settings(
+    MEDIA_ROOT=os.path.join(settings.BASE_DIR, 'temp_media_storage'))
+class ContentAddressedStorageTest(TestCase):
+    content = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_same_content_is_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом, пока он нужен."""
+        first = Post.objects.create(
+            text='Первая', author=self.author,
+            image=ContentFile(self.content, name='first.gif'))
+        second = Post.objects.create(
+            text='Вторая', author=self.author,
+            image=ContentFile(self.content, name='second.gif'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_content_name(first.image.name))
+        first.delete()
+        post_images.delete(second.image.name)
+        self.assertTrue(post_images.exists(second.image.name))
+        second.delete()
+        post_images.delete(second.image.name)
+        self.assertFalse(post_images.exists(second.image.name))
+
+    def test_dedupe_command_merges_legacy_files(self):
+        """Команда dedupe_images переносит старые файлы под хеш."""
+        names = [
+            default_storage.save(name, ContentFile(self.content))
+            for name in ('posts/first.gif', 'posts/second.gif')]
+        for name in names:
+            Post.objects.create(text=name, author=self.author, image=name)
+        call_command('dedupe_images', stdout=StringIO())
+        stored = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(stored), 1)
+        self.assertTrue(is_content_name(stored.pop()))
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_fill_command_adds_placeholders(self):
+        """Команда fill_image_metadata дополняет старые записи."""
+        post = Post.objects.create(
+            text='Старая', author=self.author,
+            image=ContentFile(self.content, name='old.gif'))
+        call_command('fill_image_metadata', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(post.image_placeholder.startswith('data:image/'))
+
+
+@override_settings(MEDIA_ROOT=os.path.join(settings.BASE_DIR, 'temp_media_gc'))
+class MediaGarbageCollectorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, content):
+        post = Post.objects.create(
+            text='Запись', author=self.author,
+            image=ContentFile(content, name='image.gif'))
+        self.assertTrue(thumbnails.generate_thumbnails(post.image.name))
+        return post
+
+    def test_reused_orphan_survives_gc(self):
+        """Повторная загрузка давнего файла без записей защищает его."""
+        content = ContentFile(
+            ContentAddressedStorageTest.content, name='posts/image.gif')
+        name = post_images.save(content.name, content)
+        os.utime(post_images.path(name), (0, 0))
+        self.assertEqual(post_images.save(content.name, content), name)
+        call_command('gc_media', stdout=StringIO())
+        self.assertTrue(post_images.exists(name))
+
+    def test_gc_removes_only_unreferenced_files(self):
+        """gc_media удаляет файлы и миниатюры удалённых записей."""
+        kept = self.create_post(ContentAddressedStorageTest.content)
+        removed = self.create_post(
+            ContentAddressedStorageTest.content.replace(b'\xFF', b'\x00'))
+        geometry, options = thumbnails.CARD_FALLBACK
+        kept_thumbnail, removed_thumbnail = (
+            thumbnails.thumbnail_file(post.image, geometry, **options)
+            for post in (kept, removed))
+        stray = default_storage.save('cache/stray.jpg', ContentFile(b'x'))
+        removed.delete()
+        call_command(
+            'gc_media', '--grace=0', '--batch-size=1', stdout=StringIO())
+        self.assertTrue(post_images.exists(kept.image.name))
+        self.assertTrue(kept_thumbnail.exists())
+        self.assertFalse(post_images.exists(removed.image.name))
+        self.assertFalse(removed_thumbnail.exists())
+        self.assertIsNone(sorl_default.kvstore.get(removed_thumbnail))
+        self.assertFalse(default_storage.exists(stray))
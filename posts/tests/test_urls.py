@@ -21,6 +21,7 @@ class PostURLTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.user = User.objects.get(username='IvanovII')
         self.authorized_client = Client()
@@ -137,10 +138,9 @@ class PostURLTests(TestCase):
         """Проверка cache на странице index."""
         response = self.authorized_client.get(reverse('posts:index'))
         previous_content = response.content
-        Post.objects.create(
-            text='Тестовый пост 1',
-            author=self.user,
-        )
+        changed_text = 'Текст, изменённый в обход сигналов'
+        Post.objects.filter(pk=PostURLTests.post.pk).update(
+            text=changed_text, text_html=changed_text)
         response = self.authorized_client.get(reverse('posts:index'))
         current_content = response.content
         self.assertEqual(previous_content, current_content)
@@ -149,6 +149,16 @@ class PostURLTests(TestCase):
         last_content = response.content
         self.assertNotEquals(current_content, last_content)
 
+    def test_new_post_invalidates_index_cache(self):
+        """Новая запись сразу сбрасывает кеш страницы index."""
+        self.authorized_client.get(reverse('posts:index'))
+        Post.objects.create(
+            text='Свежая запись',
+            author=self.user,
+        )
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Свежая запись')
+
     def test_user_can_follow_and_unfollow_other_author(self):
         """пользователь может подписываться на других пользователей
         и удалять их из подписок.
@@ -1,13 +1,26 @@
 import os
 import shutil
+from concurrent.futures import Future
+from unittest import mock
 
 from django import forms
 from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.paginator import Paginator
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from sorl.thumbnail import default as sorl_default, get_thumbnail
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
 
-from posts.models import Group, Post, User
+from posts import thumbnails
+from posts.models import Comment, Follow, Group, Post, User
+from posts.pagination import ELLIPSIS, MAX_OFFSET_PAGE, elided_page_range
+from posts.stats import get_stats
 
 
 @override_settings(MEDIA_ROOT=os.path.join(settings.BASE_DIR, 'temp_media'))
@@ -46,6 +59,7 @@ class PostPagesTests(TestCase):
         super().tearDownClass()
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.get(username='IvanovII')
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -187,6 +201,7 @@ class PaginatorViewsTest(TestCase):
             )
 
     def setUp(self):
+        cache.clear()
         self.user = User.objects.get(username='IvanovII')
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -200,3 +215,602 @@ class PaginatorViewsTest(TestCase):
         '''Паджинатор на 2-й странице index выдаёт верное количество записей'''
         response = self.client.get(reverse('posts:index') + '?page=2')
         self.assertEqual(len(response.context.get('page').object_list), 3)
+
+    def test_cursor_pages_match_numbered_pages(self):
+        '''Переход по курсору выдаёт те же записи, что и ?page='''
+        first_page = self.client.get(reverse('posts:index')).context['page']
+        response = self.client.get(
+            reverse('posts:index') + f'?cursor={first_page.next_cursor}')
+        second_page = response.context['page']
+        numbered = self.client.get(reverse('posts:index') + '?page=2')
+        self.assertEqual(second_page.number, 2)
+        self.assertEqual(
+            list(second_page.object_list),
+            list(numbered.context['page'].object_list)
+        )
+        self.assertIsNone(second_page.next_cursor)
+        response = self.client.get(
+            reverse('posts:index') + f'?cursor={second_page.previous_cursor}')
+        self.assertEqual(
+            list(response.context['page'].object_list),
+            list(first_page.object_list)
+        )
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        '''Испорченный курсор не ломает страницу'''
+        response = self.client.get(reverse('posts:index') + '?cursor=abc')
+        self.assertEqual(response.context['page'].number, 1)
+        self.assertEqual(len(response.context['page'].object_list), 10)
+
+    def test_post_count_is_cached_between_requests(self):
+        '''Число записей берётся из кеша и обновляется при создании поста'''
+        self.client.get(reverse('posts:index'))
+        Post.objects.create(text='Ещё один пост', author=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page'].paginator.count, 14)
+        self.assertFalse(any(
+            query['sql'].startswith('SELECT COUNT(')
+            for query in queries.captured_queries
+        ))
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='IvanovII')
+        Post.objects.bulk_create(
+            Post(text=f'Запись {number}', author=cls.author)
+            for number in range(195))
+
+    def setUp(self):
+        cache.clear()
+
+    def get_page(self, query=''):
+        response = self.client.get(reverse('posts:index') + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page']
+
+    def expected(self, number):
+        return list(Post.objects.order_by('-pub_date', '-pk').values_list(
+            'pk', flat=True)[(number - 1) * 10:number * 10])
+
+    def test_every_paginator_link_opens_its_page(self):
+        """Номера пагинатора ведут на свои страницы, глубокие — по курсору"""
+        pages, queue = {1: ''}, ['']
+        while queue:
+            page = self.get_page(queue.pop())
+            self.assertEqual(
+                [post.pk for post in page.object_list],
+                self.expected(page.number))
+            for number, link in page.page_links:
+                if link is None or number in pages:
+                    continue
+                if link.startswith('?page='):
+                    self.assertLessEqual(number, MAX_OFFSET_PAGE)
+                pages[number] = link
+                queue.append(link)
+        self.assertEqual(sorted(pages), list(range(1, 21)))
+
+    def test_deep_numbered_pages_are_capped(self):
+        """Глубокие ?page= не выполняются через OFFSET"""
+        self.assertEqual(self.get_page(f'?page={MAX_OFFSET_PAGE}').number,
+                         MAX_OFFSET_PAGE)
+        response = self.client.get(reverse('posts:index') + '?page=10')
+        self.assertEqual(response.status_code, 404)
+        last = self.get_page('?page=20')
+        self.assertEqual(last.number, 20)
+        self.assertEqual(
+            [post.pk for post in last.object_list], self.expected(20))
+
+    def test_cursor_page_follows_deleted_rows(self):
+        """После удаления записей страница по курсору не врёт о соседях"""
+        first = self.get_page()
+        keep = self.expected(1) + self.expected(2)[:5]
+        Post.objects.exclude(pk__in=keep).delete()
+        page = self.get_page(f'?cursor={first.next_cursor}')
+        self.assertEqual(len(page.object_list), 5)
+        self.assertEqual(page.number, 2)
+        self.assertFalse(page.has_next())
+        self.assertIsNone(page.next_cursor)
+
+
+class ElidedPageRangeTests(TestCase):
+    def test_window_around_current_page(self):
+        """Выводятся края и окно вокруг текущей страницы"""
+        paginator = Paginator(range(20000), 10)
+        self.assertEqual(
+            elided_page_range(paginator, 1000),
+            [1, ELLIPSIS, 998, 999, 1000, 1001, 1002, ELLIPSIS, 2000]
+        )
+        self.assertEqual(
+            elided_page_range(paginator, 2),
+            [1, 2, 3, 4, ELLIPSIS, 2000]
+        )
+
+    def test_short_range_is_not_elided(self):
+        """Короткий список страниц выводится целиком"""
+        paginator = Paginator(range(40), 10)
+        self.assertEqual(elided_page_range(paginator, 2), [1, 2, 3, 4])
+
+
+class ListingQueriesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='IvanovII')
+        cls.reader = User.objects.create_user(username='PetrovPP')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание'
+        )
+        get_stats(cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(12):
+            post = Post.objects.create(
+                text=f'{i} Тестовый пост',
+                author=cls.author,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                post=post, author=cls.reader, text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def test_listing_query_count_does_not_depend_on_page_size(self):
+        """Число запросов страниц со списком записей не растёт с их числом"""
+        pages = {
+            reverse('posts:index'): 4,
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}): 6,
+            reverse('posts:profile', kwargs={'username': 'IvanovII'}): 7,
+            reverse('posts:follow_index'): 4,
+        }
+        for url, expected in pages.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(expected):
+                    response = self.authorized_client.get(url)
+                self.assertEqual(len(response.context['page']), 10)
+                self.assertContains(response, 'Комментариев: 1')
+
+    def test_listing_queries_use_indexes(self):
+        """Запросы страниц идут по индексам, без полного прохода таблиц"""
+        post = Post.objects.filter(author=self.author).first()
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'IvanovII'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post', kwargs={'username': 'IvanovII',
+                                          'post_id': post.id}),
+        ]
+        for url in urls[:4]:
+            page = self.authorized_client.get(url).context['page']
+            urls.append(f'{url}?cursor={page.next_cursor}')
+        for url in urls:
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    self.authorized_client.get(url)
+                for query in queries.captured_queries:
+                    if 'posts_' not in query['sql']:
+                        continue
+                    with connection.cursor() as cursor:
+                        cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                        plan = [row[-1] for row in cursor.fetchall()]
+                    for step in plan:
+                        self.assertFalse(
+                            step.startswith('SCAN') and 'USING' not in step,
+                            f'{query["sql"]}: {plan}'
+                        )
+                        self.assertNotIn('TEMP B-TREE', step)
+
+
+class FollowFeedCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='IvanovII')
+        cls.reader = User.objects.create_user(username='PetrovPP')
+        cls.stranger = User.objects.create_user(username='SidorovSS')
+        Post.objects.create(text='Запись автора', author=cls.author)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+        self.stranger_client = Client()
+        self.stranger_client.force_login(self.stranger)
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': 'IvanovII'}))
+
+    def test_feed_cache_is_per_user(self):
+        """Кеш ленты подписок не общий для разных пользователей"""
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Запись автора')
+        response = self.stranger_client.get(reverse('posts:follow_index'))
+        self.assertNotContains(response, 'Запись автора')
+
+    def test_feed_cache_follows_timeline_changes(self):
+        """Новые записи и отписка сразу видны в ленте"""
+        self.reader_client.get(reverse('posts:follow_index'))
+        Post.objects.create(text='Новая запись автора', author=self.author)
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Новая запись автора')
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'IvanovII'}))
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertNotContains(response, 'Запись автора')
+
+    def test_group_rename_reaches_feed(self):
+        """Новое название группы сразу видно в ленте подписок"""
+        group = Group.objects.create(title='Старое название', slug='renamed')
+        Post.objects.create(
+            text='Запись в группе', author=self.author, group=group)
+        self.reader_client.get(reverse('posts:follow_index'))
+        group.title = 'Новое название'
+        group.save()
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Новое название')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='IvanovII')
+        cls.reader = User.objects.create_user(username='PetrovPP')
+        cls.group = Group.objects.create(title='Группа', slug='test-slug')
+        cls.post = Post.objects.create(
+            text='Запись автора', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': 'test-slug'}),
+            reverse('posts:profile', kwargs={'username': 'IvanovII'}),
+            reverse('posts:post', kwargs={'username': 'IvanovII',
+                                          'post_id': self.post.pk}),
+        )
+
+    def test_unchanged_pages_answer_not_modified(self):
+        """Неизменившаяся страница отдаётся как 304 без рендеринга"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertIsNone(response.context)
+                response = self.guest_client.get(
+                    url,
+                    HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_produce_new_validators(self):
+        """Новая запись меняет ETag всех страниц, где она видна"""
+        etags = {url: self.guest_client.get(url)['ETag']
+                 for url in self.urls}
+        Post.objects.create(
+            text='Новая запись', author=self.author, group=self.group)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Страница другого пользователя не считается той же"""
+        url = self.urls[2]
+        etag = self.guest_client.get(url)['ETag']
+        reader_client = Client()
+        reader_client.force_login(self.reader)
+        response = reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    MEDIA_ROOT=os.path.join(settings.BASE_DIR, 'temp_media_thumbnails'),
+    THUMBNAIL_WORKERS=0)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='IvanovII')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        thumbnails._pending.clear()
+        thumbnails._failed.clear()
+        self.image = SimpleUploadedFile(
+            name='small.gif',
+            content=(
+                b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                b'\x0A\x00\x3B'
+            ),
+            content_type='image/gif'
+        )
+
+    def test_listing_never_decodes_images(self):
+        """Страница с новой картинкой отдаёт заглушку, не читая файл"""
+        with mock.patch.object(thumbnails.transaction, 'on_commit'):
+            Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+            with mock.patch.object(
+                    sorl_default.engine, 'get_image') as get_image:
+                response = self.client.get(reverse('posts:index'))
+        get_image.assert_not_called()
+        self.assertContains(response, 'padding-top: 35.3%')
+        self.assertNotContains(response, '<img class="card-img"')
+
+    def test_upload_generates_thumbnails_in_background(self):
+        """Загрузка ставит создание миниатюр в пул, затем видна картинка"""
+        callbacks = []
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               callbacks.append):
+            Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+            self.client.get(reverse('posts:index'))
+            for callback in callbacks:
+                callback()
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(len(callbacks), 2)
+        self.assertContains(response, '<img class="card-img"')
+
+    def test_tests_never_start_worker_processes(self):
+        """При THUMBNAIL_WORKERS = 0 миниатюры создаются без пула"""
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               lambda callback: callback()), \
+                mock.patch.object(
+                    thumbnails, 'ProcessPoolExecutor') as pool:
+            post = Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+            response = self.client.get(reverse('posts:index'))
+        pool.assert_not_called()
+        self.assertContains(response, '<img class="card-img"')
+        self.assertTrue(thumbnails.card_thumbnails(post.image))
+
+    def test_thumbnails_from_another_process_are_shown(self):
+        """Миниатюры видны, даже если задача писала в свой кеш"""
+        generate = thumbnails.generate_thumbnails
+        worker_cache = LocMemCache('thumbnail-worker', {})
+
+        def generate_elsewhere(name):
+            with mock.patch.object(KVStore, 'cache', new_callable=mock.
+                                   PropertyMock, return_value=worker_cache):
+                return generate(name)
+
+        with mock.patch.object(thumbnails.transaction, 'on_commit'):
+            post = Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+            self.client.get(reverse('posts:index'))
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               lambda callback: callback()), \
+                mock.patch.object(thumbnails, 'generate_thumbnails',
+                                  generate_elsewhere):
+            thumbnails.schedule_thumbnails(post.image.name, post)
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<img class="card-img"')
+
+    def test_missing_thumbnails_are_not_cached(self):
+        """Промах по миниатюре не остаётся в кеше"""
+        with mock.patch.object(thumbnails.transaction, 'on_commit'):
+            post = Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+            self.client.get(reverse('posts:index'))
+        keys = [
+            add_prefix(thumbnails.thumbnail_file(
+                post.image, geometry, **options).key)
+            for geometry, options in thumbnails.GEOMETRIES]
+        self.assertEqual(sorl_default.kvstore.cache.get_many(keys), {})
+        thumbnails.generate_thumbnails(post.image.name)
+        self.assertTrue(thumbnails.card_thumbnails(post.image))
+
+    @override_settings(THUMBNAIL_WORKERS=None)
+    def test_disabled_thumbnails_are_never_scheduled(self):
+        """При THUMBNAIL_WORKERS = None задачи не ставятся"""
+        with mock.patch.object(
+                thumbnails.transaction, 'on_commit') as on_commit:
+            Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+            self.client.get(reverse('posts:index'))
+        on_commit.assert_not_called()
+
+    def test_job_errors_allow_retry(self):
+        """Сбой задачи не помечает картинку как нечитаемую"""
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               lambda callback: callback()), \
+                mock.patch.object(thumbnails, 'generate_thumbnails',
+                                  side_effect=RuntimeError), \
+                self.assertLogs('posts.thumbnails', 'ERROR'):
+            thumbnails.schedule_thumbnails('posts/image.gif')
+        self.assertNotIn('posts/image.gif', thumbnails._failed)
+        self.assertNotIn('posts/image.gif', thumbnails._pending)
+
+    def test_finished_thumbnails_reach_follow_feed(self):
+        """Готовая картинка сменяет заглушку и в ленте подписок"""
+        reader = User.objects.create_user(username='PetrovPP')
+        Follow.objects.create(user=reader, author=self.author)
+        self.client.force_login(reader)
+        with mock.patch.object(thumbnails.transaction, 'on_commit'):
+            post = Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+            self.client.get(reverse('posts:follow_index'))
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               lambda callback: callback()):
+            thumbnails.schedule_thumbnails(post.image.name, post)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertContains(response, '<img class="card-img"')
+
+    def test_pending_job_collects_tags_of_every_post(self):
+        """Готовые миниатюры сбрасывают теги всех записей с картинкой"""
+        future = Future()
+        executor = mock.Mock(**{'submit.return_value': future})
+        with mock.patch.object(thumbnails.transaction, 'on_commit'):
+            first, second = (
+                Post.objects.create(
+                    text=text, author=self.author, image=self.image)
+                for text in ('Первая', 'Вторая'))
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               lambda callback: callback()), \
+                mock.patch.object(thumbnails, '_get_executor',
+                                  return_value=executor), \
+                mock.patch.object(thumbnails, 'invalidate') as invalidate:
+            for post in (first, second):
+                thumbnails.schedule_thumbnails(post.image.name, post)
+            future.set_result(True)
+        executor.submit.assert_called_once()
+        self.assertIn(f'post:{first.pk}', invalidate.call_args[0])
+        self.assertIn(f'post:{second.pk}', invalidate.call_args[0])
+
+    def test_thumbnail_names_match_sorl(self):
+        """Имена миниатюр без чтения файлов совпадают с именами sorl"""
+        with mock.patch.object(thumbnails.transaction, 'on_commit'):
+            post = Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+        for geometry, options in thumbnails.GEOMETRIES:
+            with self.subTest(geometry=geometry, options=options):
+                self.assertEqual(
+                    thumbnails.thumbnail_file(
+                        post.image, geometry, **options).name,
+                    get_thumbnail(post.image, geometry, **options).name)
+
+    def test_unreadable_sources_are_retried_later(self):
+        """Нечитаемый исходник пропускается на время, а список ограничен"""
+        name = 'posts/broken.gif'
+        with mock.patch.object(thumbnails.transaction, 'on_commit',
+                               lambda callback: callback()), \
+                mock.patch.object(thumbnails, 'generate_thumbnails',
+                                  return_value=False) as generate:
+            thumbnails.schedule_thumbnails(name)
+            thumbnails.schedule_thumbnails(name)
+            self.assertEqual(generate.call_count, 1)
+            later = thumbnails.time.monotonic() + thumbnails.FAILED_TIMEOUT
+            with mock.patch.object(thumbnails.time, 'monotonic',
+                                   return_value=later):
+                thumbnails.schedule_thumbnails(name)
+            self.assertEqual(generate.call_count, 2)
+            with mock.patch.object(thumbnails, 'FAILED_MAX_ENTRIES', 2):
+                for number in range(3):
+                    thumbnails.schedule_thumbnails(f'posts/{number}.gif')
+        self.assertEqual(list(thumbnails._failed), ['posts/1.gif',
+                                                    'posts/2.gif'])
+
+    def test_card_image_has_webp_srcset(self):
+        """Карточка предлагает WebP нескольких ширин и запасной JPEG"""
+        with mock.patch.object(thumbnails.transaction, 'on_commit'):
+            post = Post.objects.create(
+                text='Запись', author=self.author, image=self.image)
+        self.assertTrue(thumbnails.generate_thumbnails(post.image))
+        response = self.client.get(reverse('posts:index'))
+        content = response.content.decode()
+        self.assertIn('<source type="image/webp"', content)
+        for width in thumbnails.CARD_WIDTHS:
+            self.assertRegex(content, rf'\.webp {width}w')
+        self.assertRegex(content, r'<img class="card-img" src="[^"]+\.jpg"')
+        self.assertIn('width="960" height="339" loading="lazy"', content)
+
+    def test_page_looks_up_thumbnails_once(self):
+        """Миниатюры всей страницы ищутся одним запросом к хранилищу"""
+        for number in range(10):
+            image = SimpleUploadedFile(
+                name=f'small_{number}.gif', content=self.image.read(),
+                content_type='image/gif')
+            self.image.seek(0)
+            with mock.patch.object(thumbnails.transaction, 'on_commit'):
+                Post.objects.create(
+                    text=f'Запись {number}', author=self.author, image=image)
+            thumbnails.generate_thumbnails(Post.objects.latest('pk').image)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        lookups = [query for query in queries.captured_queries
+                   if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertContains(response, '<img class="card-img"', count=10)
+
+
+@override_settings(MEDIA_ROOT=os.path.join(settings.BASE_DIR, 'temp_media'))
+class MediaViewTests(TestCase):
+    content = b'0123456789'
+
+    def setUp(self):
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'posts'), exist_ok=True)
+        with open(os.path.join(
+                settings.MEDIA_ROOT, 'posts', 'file.bin'), 'wb') as file_:
+            file_.write(self.content)
+        self.url = reverse('media', args=['posts/file.bin'])
+
+    def tearDown(self):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_file_has_validators(self):
+        """Файл отдаётся целиком с ETag и Last-Modified"""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_range_requests(self):
+        """Range отдаёт часть файла, невыполнимый диапазон — 416"""
+        ranges = {
+            'bytes=2-5': (206, b'2345', 'bytes 2-5/10'),
+            'bytes=7-': (206, b'789', 'bytes 7-9/10'),
+            'bytes=-2': (206, b'89', 'bytes 8-9/10'),
+            'bytes=0-1,4-5': (200, self.content, None),
+        }
+        for header, (status, body, content_range) in ranges.items():
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(b''.join(response.streaming_content), body)
+                self.assertEqual(response.get('Content-Range'), content_range)
+                self.assertEqual(response['Content-Length'], str(len(body)))
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        """Если файл изменился (If-Range), диапазон не применяется"""
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    @override_settings(MEDIA_SENDFILE='X-Accel-Redirect')
+    def test_transfer_is_handed_to_proxy(self):
+        """С MEDIA_SENDFILE файл отправляет фронтенд-сервер"""
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/internal-media/posts/file.bin')
+        self.assertEqual(response.content, b'')
+
+    def test_paths_outside_media_root_are_not_found(self):
+        """Файлы вне MEDIA_ROOT и каталоги не отдаются"""
+        for path in ('../manage.py', 'posts', 'posts/missing.bin'):
+            with self.subTest(path=path):
+                response = self.client.get(reverse('media', args=[path]))
+                self.assertEqual(response.status_code, 404)
+
+    def test_unreadable_paths_are_not_found(self):
+        """Нулевой байт в пути и закрытые файлы дают 404, а не 500"""
+        response = self.client.get('/media/posts/a%00b.jpg')
+        self.assertEqual(response.status_code, 404)
+        for error in (PermissionError, FileNotFoundError):
+            with self.subTest(error=error), mock.patch(
+                    'yatube.media.open', side_effect=error, create=True):
+                response = self.client.get(self.url)
+                self.assertEqual(response.status_code, 404)
@@ -0,0 +1,290 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.db import transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from .cache import invalidate, post_cache_tags
+from .storage import post_images
+
+logger = logging.getLogger(__name__)
+
+CARD_WIDTHS = (320, 640, 960)
+CARD_RATIO = 339 / 960
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+CARD_SIZES = '(min-width: 1200px) 1110px, 100vw'
+
+
+def card_geometry(width):
+    return f'{width}x{round(width * CARD_RATIO)}'
+
+
+CARD_VARIANTS = tuple(
+    (card_geometry(width), dict(CARD_OPTIONS, format='WEBP'))
+    for width in CARD_WIDTHS)
+CARD_FALLBACK = (card_geometry(CARD_WIDTHS[-1]), CARD_OPTIONS)
+GEOMETRIES = (*CARD_VARIANTS, CARD_FALLBACK)
+FAILED_TIMEOUT = 60 * 60
+FAILED_MAX_ENTRIES = 1000
+
+_executor = None
+_pending = {}
+_failed = OrderedDict()
+_lock = threading.Lock()
+
+
+def _setup_worker():
+    import django
+    django.setup()
+
+
+class InlineExecutor:
+    """Выполняет задачу сразу в текущем процессе (THUMBNAIL_WORKERS = 0)."""
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+def _get_executor():
+    """Пул процессов для миниатюр.
+
+    THUMBNAIL_WORKERS = 0 — миниатюры создаются в текущем процессе
+    (так запускаются тесты: дочерние процессы не видят тестовую базу
+    и override_settings), None — не создаются вовсе.
+    """
+    global _executor
+    workers = settings.THUMBNAIL_WORKERS
+    if not workers:
+        return InlineExecutor()
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context('spawn'),
+                initializer=_setup_worker,
+            )
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _lock:
+        _executor = None
+
+
+def generate_thumbnails(name):
+    """Создаёт миниатюры во всех размерах из GEOMETRIES.
+
+    Возвращает False, если исходное изображение прочитать не удалось.
+    """
+    source = ImageFile(name, post_images)
+    return all(
+        get_thumbnail(source, geometry, **options).exists()
+        for geometry, options in GEOMETRIES)
+
+
+def delete_thumbnails(name, storages=(post_images,)):
+    """Удаляет миниатюры исходника name и их записи в хранилище sorl."""
+    for storage in storages:
+        default.kvstore.delete(ImageFile(name, storage))
+
+
+def forget_thumbnails(name):
+    """Убирает миниатюры name из кеша sorl текущего процесса.
+
+    Задачу выполняет другой процесс, и его записи в кеш сюда могут
+    не дойти (LocMemCache у каждого процесса свой): без этого здесь
+    остался бы закешированный промах.
+    """
+    cache = getattr(default.kvstore, 'cache', None)
+    if cache is None:
+        return
+    source = ImageFile(name, post_images)
+    cache.delete_many([
+        add_prefix(thumbnail_file(source, geometry, **options).key)
+        for geometry, options in GEOMETRIES])
+
+
+def thumbnail_file(file_, geometry, **options):
+    """Миниатюра, которую sorl создаст для file_, без чтения файлов.
+
+    Повторяет выбор имени в sorl через его закрытые методы, поэтому
+    версия sorl-thumbnail зафиксирована в requirements.txt, а совпадение
+    имён проверяют тесты.
+    """
+    backend = default.backend
+    source = ImageFile(file_)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def _stored(thumbnails):
+    """Ищет все миниатюры разом: get_many в кеше и один запрос к БД.
+
+    Промахи не кешируются: миниатюра, скорее всего, как раз создаётся,
+    и пустая запись могла бы перекрыть ту, что запишет задача.
+    """
+    from sorl.thumbnail.kvstores.cached_db_kvstore import (
+        EMPTY_VALUE, KVStore as CachedDBKVStore)
+    from sorl.thumbnail.models import KVStore as KVStoreModel
+
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {thumbnail.name: kvstore.get(thumbnail)
+                for thumbnail in thumbnails}
+    keys = {add_prefix(thumbnail.key): thumbnail for thumbnail in thumbnails}
+    values = kvstore.cache.get_many(list(keys))
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        kvstore.cache.set_many(found, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(found)
+    return {
+        thumbnail.name: (
+            deserialize_image_file(values[key])
+            if values.get(key) not in (None, EMPTY_VALUE) else None)
+        for key, thumbnail in keys.items()
+    }
+
+
+def ready_thumbnails(files, geometries=GEOMETRIES):
+    """Готовые миниатюры всех files одним обращением к хранилищу sorl.
+
+    Возвращает {имя миниатюры: ImageFile или None}. Исходные изображения
+    не читаются: недостающие миниатюры ставятся в очередь.
+    """
+    wanted = {
+        file_: [thumbnail_file(file_, geometry, **options)
+                for geometry, options in geometries]
+        for file_ in files if file_}
+    found = _stored(
+        thumbnail for thumbnails in wanted.values()
+        for thumbnail in thumbnails)
+    for file_, thumbnails in wanted.items():
+        if any(found[thumbnail.name] is None for thumbnail in thumbnails):
+            schedule_thumbnails(
+                file_.name, getattr(file_, 'instance', None))
+    return found
+
+
+def card_thumbnails(file_, prefetched=None):
+    """Картинка карточки или None, пока готовы не все её варианты.
+
+    Возвращает {'srcset': WebP всех ширин из CARD_WIDTHS, 'sizes': ...,
+    'fallback': миниатюра в формате THUMBNAIL_FORMAT для браузеров без
+    WebP}. Миниатюры ищутся в prefetched, если там уже есть все.
+    """
+    if not file_:
+        return None
+    names = [thumbnail_file(file_, geometry, **options).name
+             for geometry, options in GEOMETRIES]
+    if prefetched is None or any(name not in prefetched for name in names):
+        prefetched = ready_thumbnails([file_])
+    *variants, fallback = (prefetched[name] for name in names)
+    if fallback is None or None in variants:
+        return None
+    return {
+        'srcset': ', '.join(
+            f'{variant.url} {variant.width}w' for variant in variants),
+        'sizes': CARD_SIZES,
+        'fallback': fallback,
+    }
+
+
+def schedule_thumbnails(name, post=None):
+    """Ставит создание миниатюр в пул процессов после фиксации транзакции.
+
+    Когда миниатюры готовы, сбрасываются теги страниц записи, чтобы
+    заглушка сменилась картинкой, и ленты подписчиков автора. Пока
+    задача в очереди, теги и авторы новых вызовов для той же картинки
+    добавляются к её собственным.
+    """
+    if settings.THUMBNAIL_WORKERS is None:
+        return
+    tags = post_cache_tags(post) if post is not None else ()
+    authors = {post.author_id} if post is not None else set()
+
+    def submit():
+        with _lock:
+            if _is_failed(name):
+                return
+            if name in _pending:
+                _pending[name][0].update(tags)
+                _pending[name][1].update(authors)
+                return
+            _pending[name] = (set(tags), authors)
+        try:
+            future = _get_executor().submit(generate_thumbnails, name)
+        except BrokenProcessPool as error:
+            future = Future()
+            future.set_exception(error)
+        future.add_done_callback(lambda future: finished(name, future))
+
+    transaction.on_commit(submit)
+
+
+def _is_failed(name):
+    failed_at = _failed.get(name)
+    if failed_at is None:
+        return False
+    if time.monotonic() - failed_at < FAILED_TIMEOUT:
+        return True
+    del _failed[name]
+    return False
+
+
+def _mark_failed(name):
+    _failed[name] = time.monotonic()
+    _failed.move_to_end(name)
+    while len(_failed) > FAILED_MAX_ENTRIES:
+        _failed.popitem(last=False)
+
+
+def finished(name, future):
+    """Итог задачи; в _failed попадают только нечитаемые исходники.
+
+    Нечитаемый исходник не ставится в очередь FAILED_TIMEOUT секунд,
+    а _failed хранит не больше FAILED_MAX_ENTRIES имён. После сбоя
+    самого пула он пересоздаётся, а картинка будет поставлена в очередь
+    снова при следующем показе.
+    """
+    error = future.exception()
+    if isinstance(error, BrokenProcessPool):
+        _reset_executor()
+    with _lock:
+        tags, authors = _pending.pop(name, ((), ()))
+        if error is None and not future.result():
+            _mark_failed(name)
+    if error is not None:
+        logger.error('Не удалось создать миниатюры %s', name, exc_info=error)
+    elif future.result():
+        forget_thumbnails(name)
+        if tags:
+            invalidate(*tags)
+        if authors:
+            from .feed import authors_follower_ids, invalidate_feeds
+            invalidate_feeds(authors_follower_ids(authors))
@@ -1,30 +1,35 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
 
+from .cache import tag_page
+from .conditional import (conditional_page, group_page_tags, group_tags,
+                          index_page_tags, post_page_tags, post_tags,
+                          profile_page_tags, profile_tags)
 from .forms import CommentForm, PostForm
+from .holes import render_page
 from .models import Follow, Group, Post, User
+from .pagination import get_cursor_page, get_page
+from .stats import get_stats
 
 
+@conditional_page(index_page_tags)
 def index(request):
-    all_posts = Post.objects.all()
-    paginator = Paginator(all_posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(
+    tag_page(request, *index_page_tags())
+    page = get_cursor_page(request, Post.objects.for_listing(), 'posts')
+    return render_page(
         request,
         './posts/index.html',
         {'page': page, }
     )
 
 
+@conditional_page(group_tags)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    all_posts = group.posts.all()
-    paginator = Paginator(all_posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(
+    tag_page(request, *group_page_tags(group.pk))
+    page = get_cursor_page(
+        request, group.posts.for_listing(), f'group:{group.pk}')
+    return render_page(
         request,
         'group.html',
         {'group': group,
@@ -34,10 +39,7 @@ def group_posts(request, slug):
 
 
 def group_list(request):
-    groups = Group.objects.all()
-    paginator = Paginator(groups, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page = get_page(request, Group.objects.all(), 'groups')
     return render(
         request,
         './posts/group_list.html',
@@ -45,26 +47,22 @@ def group_list(request):
     )
 
 
+@conditional_page(profile_tags)
 def profile(request, username):
-    post_author = get_object_or_404(User, username=username)
-    user_posts = post_author.posts.all()
-    post_count = user_posts.count()
-    paginator = Paginator(user_posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    follow_check = request.user.is_authenticated and Follow.objects.filter(
-        user=request.user, author=post_author).exists()
-    following = post_author.following.count()
-    follower = post_author.follower.count()
-    return render(
+    post_author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    tag_page(request, *profile_page_tags(post_author.pk))
+    page = get_cursor_page(
+        request, post_author.posts.for_listing(), f'author:{post_author.pk}')
+    stats = get_stats(post_author)
+    return render_page(
         request,
         './posts/profile.html',
         {'page': page,
          'author': post_author,
-         'post_count': post_count,
-         'following': following,
-         'follower': follower,
-         'follow_check': follow_check
+         'post_count': stats.posts_count,
+         'following': stats.followers_count,
+         'follower': stats.following_count,
          }
     )
 
@@ -81,22 +79,26 @@ def add_comment(request, username, post_id):
     return redirect('posts:post', username, post_id)
 
 
+@conditional_page(post_tags)
 def post_view(request, username, post_id):
-    user_post = get_object_or_404(Post, author__username=username, id=post_id)
-    post_count = user_post.author.posts.count()
+    user_post = get_object_or_404(
+        Post.objects.select_related('author__stats'),
+        author__username=username,
+        id=post_id
+    )
+    tag_page(request, *post_page_tags(user_post))
+    stats = get_stats(user_post.author)
     form = CommentForm(instance=None)
-    following = user_post.author.following.count()
-    follower = user_post.author.follower.count()
-    return render(
+    return render_page(
         request,
         './posts/post.html',
         {'author': user_post.author,
          'post': user_post,
-         'post_count': post_count,
+         'post_count': stats.posts_count,
          'comments': user_post.comments.all(),
          'form': form,
-         'following': following,
-         'follower': follower,
+         'following': stats.followers_count,
+         'follower': stats.following_count,
          }
     )
 
@@ -145,15 +147,19 @@ def delete_post(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    selected_posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(selected_posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(
+    page = get_cursor_page(
+        request,
+        Post.objects.for_listing(),
+        f'feed:{request.user.pk}',
+        date_field='feed_items__pub_date',
+        pk_field='feed_items__post',
+        feed_items__user=request.user
+    )
+    return render_page(
         request,
         './posts/follow.html',
         {'page': page,
-         'paginator': paginator,
+         'paginator': page.paginator,
          }
     )
 
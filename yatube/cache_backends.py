@@ -0,0 +1,386 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = '''
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS cache_usage (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_usage (id, count, size)
+    SELECT 1, COUNT(*), COALESCE(SUM(size), 0) FROM cache
+    WHERE NOT EXISTS (SELECT 1 FROM cache_usage);
+CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache BEGIN
+    UPDATE cache_usage SET count = count + 1, size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN
+    UPDATE cache_usage SET count = count - 1, size = size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_resized AFTER UPDATE OF size ON cache
+BEGIN
+    UPDATE cache_usage SET size = size - OLD.size + NEW.size;
+END;
+COMMIT;
+'''
+TOUCH_INTERVAL = 1.0
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite, общий для всех процессов одного хоста.
+
+    Размер ограничен числом записей (MAX_ENTRIES) и суммарным объёмом
+    значений в байтах (MAX_SIZE); при переполнении вытесняются записи,
+    к которым дольше всего не обращались. Число записей и их объём
+    триггеры ведут в таблице cache_usage в той же транзакции, что
+    и запись, поэтому проверка переполнения не сканирует кеш.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._max_size = params.get('OPTIONS', {}).get('MAX_SIZE')
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute('PRAGMA recursive_triggers=ON')
+            db.executescript(SCHEMA)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _fetch(self, keys):
+        now = time.time()
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._db.execute(
+            f'SELECT key, value, expires, accessed FROM cache '
+            f'WHERE key IN ({placeholders})', keys).fetchall()
+        found, touched = {}, []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed > TOUCH_INTERVAL:
+                touched.append((now, key))
+        if touched:
+            self._db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', touched)
+        return found
+
+    def _write(self, db, key, value, timeout, mode='REPLACE'):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        cursor = db.execute(
+            f'INSERT OR {mode} INTO cache '
+            f'(key, value, expires, accessed, size) VALUES (?, ?, ?, ?, ?)',
+            (key, blob, expires, time.time(), len(blob)))
+        return cursor.rowcount == 1
+
+    def _usage(self, db):
+        return db.execute('SELECT count, size FROM cache_usage').fetchone()
+
+    def _is_full(self, count, size):
+        return count > self._max_entries or (
+            self._max_size is not None and size > self._max_size)
+
+    def _cull(self, db):
+        if not self._is_full(*self._usage(db)):
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count, size = self._usage(db)
+        while self._is_full(count, size):
+            if self._cull_frequency:
+                evict = max(count // self._cull_frequency, 1)
+            else:
+                evict = count
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)', (evict,))
+            count, size = self._usage(db)
+
+    def _purge_expired(self, db, key):
+        db.execute(
+            'DELETE FROM cache WHERE key = ? AND expires <= ?',
+            (key, time.time()))
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        found = self._fetch(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        db = self._db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            self._write(db, key, value, timeout)
+            self._cull(db)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        db = self._db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            for key, value in data.items():
+                self._write(db, self._key(key, version), value, timeout)
+            self._cull(db)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        db = self._db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            self._purge_expired(db, key)
+            added = self._write(db, key, value, timeout, mode='IGNORE')
+            if added:
+                self._cull(db)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        db = self._db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            self._purge_expired(db, key)
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?', (blob, len(blob), time.time(), key))
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._db.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()))
+        return cursor.rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._fetch([key])
+
+    def delete(self, key, version=None):
+        self._db.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._db.execute(
+                f'DELETE FROM cache WHERE key IN ({placeholders})', keys)
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+
+class TwoTierCache(BaseCache):
+    """Локальный LRU-кеш процесса (L1) перед общим бэкендом (L2).
+
+    OPTIONS['L2'] — псевдоним общего кеша из CACHES, LOCATION — файл
+    журнала инвалидации. Каждая запись через этот бэкенд дописывает ключ
+    в журнал, и остальные процессы выбрасывают его из своего L1 при
+    следующем обращении. Срок жизни записи в L1 ограничен L1_TIMEOUT,
+    поэтому даже пропущенная инвалидация устаревает быстро. Значения из
+    L1 отдаются без копирования — изменять их нельзя.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._journal = location
+        self._l2_alias = options['L2']
+        self._l1_timeout = options.get('L1_TIMEOUT', 60)
+        self._journal_limit = options.get('JOURNAL_LIMIT', 1024 * 1024)
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._inode = None
+        self._offset = 0
+
+    @property
+    def _l2(self):
+        from django.core.cache import caches
+        return caches[self._l2_alias]
+
+    def _sync(self):
+        try:
+            stat = os.stat(self._journal)
+        except FileNotFoundError:
+            inode, size = None, 0
+        else:
+            inode, size = stat.st_ino, stat.st_size
+        if inode != self._inode:
+            self._l1.clear()
+            self._inode, self._offset = inode, size
+            return
+        if size <= self._offset:
+            return
+        with open(self._journal, 'rb') as journal:
+            journal.seek(self._offset)
+            chunk = journal.read(size - self._offset)
+        end = chunk.rfind(b'\n') + 1
+        self._offset += end
+        for key in chunk[:end].decode().splitlines():
+            self._l1.pop(key, None)
+
+    def _publish(self, keys):
+        with self._lock:
+            for key in keys:
+                self._l1.pop(key, None)
+        directory = os.path.dirname(self._journal)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        data = ''.join(f'{key}\n' for key in keys).encode()
+        fd = os.open(
+            self._journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self._journal_limit:
+            self._rotate()
+
+    def _rotate(self):
+        fresh = f'{self._journal}.{os.getpid()}.tmp'
+        open(fresh, 'wb').close()
+        os.replace(fresh, self._journal)
+
+    def _l1_get(self, key):
+        entry = self._l1.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._l1[key]
+            return None
+        self._l1.move_to_end(key)
+        return entry
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        ttl = self._l1_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._l1[key] = (time.monotonic() + ttl, value)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self._max_entries:
+                self._l1.popitem(last=False)
+
+    def get(self, key, default=None, version=None):
+        local = self.make_key(key, version=version)
+        with self._lock:
+            self._sync()
+            entry = self._l1_get(local)
+        if entry is not None:
+            return entry[1]
+        value = self._l2.get(key, version=version)
+        if value is None:
+            return default
+        self._l1_set(local, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        with self._lock:
+            self._sync()
+            for key in keys:
+                entry = self._l1_get(self.make_key(key, version=version))
+                if entry is None:
+                    missing.append(key)
+                else:
+                    found[key] = entry[1]
+        if missing:
+            fetched = self._l2.get_many(missing, version=version)
+            for key, value in fetched.items():
+                self._l1_set(self.make_key(key, version=version), value)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l2.set(key, value, timeout, version=version)
+        self._publish([self.make_key(key, version=version)])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._l2.set_many(data, timeout, version=version)
+        if data:
+            self._publish(
+                [self.make_key(key, version=version) for key in data])
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self._l2.add(key, value, timeout, version=version)
+        if added:
+            self._publish([self.make_key(key, version=version)])
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = self._l2.incr(key, delta, version=version)
+        self._publish([self.make_key(key, version=version)])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._l2.touch(key, timeout, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, version=version) is not None
+
+    def delete(self, key, version=None):
+        self._l2.delete(key, version=version)
+        self._publish([self.make_key(key, version=version)])
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        if keys:
+            self._l2.delete_many(keys, version=version)
+            self._publish(
+                [self.make_key(key, version=version) for key in keys])
+
+    def clear(self):
+        self._l2.clear()
+        with self._lock:
+            self._l1.clear()
+        self._rotate()
@@ -0,0 +1,164 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from posts.storage import is_content_name
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+class RangeFile:
+    """Файл, который читается только до конца запрошенного диапазона.
+
+    fileno() и tell() проксируются, поэтому wsgi.file_wrapper сервера
+    (gunicorn, uWSGI) отправляет диапазон через sendfile(), не копируя
+    байты в Python; длину он берёт из Content-Length.
+    """
+
+    def __init__(self, file_, start, length):
+        file_.seek(start)
+        self.file = file_
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """(начало, конец) единственного диапазона из заголовка Range.
+
+    None — заголовка нет или он не поддерживается (несколько диапазонов),
+    отдаётся весь файл. ValueError — диапазон за пределами файла.
+    """
+    match = RANGE.match(header or '')
+    if match is None or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        if int(end) == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - int(end), 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise ValueError(header)
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+def range_allowed(request, etag, mtime):
+    """Условие If-Range: диапазон отдаётся, только если файл не менялся."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+def offloaded_response(path, fullpath, content_type):
+    """Пустой ответ, файл по которому отправит фронтенд-сервер."""
+    response = HttpResponse(content_type=content_type)
+    header = settings.MEDIA_SENDFILE
+    if header == 'X-Accel-Redirect':
+        response[header] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+    else:
+        response[header] = fullpath
+    return response
+
+
+def file_response(request, file_, size, byte_range, content_type):
+    start, end = byte_range or (0, size - 1)
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        response = FileResponse(
+            RangeFile(file_, start, end - start + 1),
+            content_type=content_type)
+        response.block_size = BLOCK_SIZE
+    response['Content-Length'] = end - start + 1
+    if byte_range is not None:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+def media_response(request, path, file_, file_stat, etag):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if settings.MEDIA_SENDFILE:
+        return offloaded_response(path, file_.name, content_type)
+    size = file_stat.st_size
+    byte_range = None
+    if range_allowed(request, etag, file_stat.st_mtime):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416, content_type=content_type)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    return file_response(request, file_, size, byte_range, content_type)
+
+
+@require_safe
+def serve_media(request, path):
+    """Отдаёт файл из MEDIA_ROOT с поддержкой Range, ETag и Last-Modified.
+
+    Полный файл и диапазоны отдаются через FileResponse, который сервер
+    с wsgi.file_wrapper передаёт в sendfile(). Если задан MEDIA_SENDFILE,
+    отправка целиком поручается фронтенд-серверу (X-Accel-Redirect для
+    nginx, X-Sendfile для Apache и lighttpd).
+
+    Размер и время изменения берутся у уже открытого файла: файл,
+    который нельзя прочитать или который удалили между проверкой
+    и открытием, даёт 404.
+    """
+    try:
+        file_ = open(safe_join(settings.MEDIA_ROOT, path), 'rb')
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404
+    file_stat = os.fstat(file_.fileno())
+    if not stat.S_ISREG(file_stat.st_mode):
+        file_.close()
+        raise Http404
+    etag = f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(file_stat.st_mtime))
+    if response is None:
+        response = media_response(request, path, file_, file_stat, etag)
+    if not isinstance(response, FileResponse):
+        file_.close()
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(file_stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    if is_content_name(path):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=settings.MEDIA_MAX_AGE)
+    return response
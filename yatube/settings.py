@@ -6,6 +6,12 @@ SECRET_KEY = '_z@w=5!hlz3!uy907&wd#xw!1v!p=7xs1@$=9%2!pt0i!ise2p'
 
 DEBUG = True
 
+# Кеш целых страниц (posts.middleware) и общий для всех процессов кеш
+# в файлах SQLite в каталоге SHARED_CACHE_DIR включаются отдельно,
+# например PAGE_CACHE=1 SHARED_CACHE_DIR=/var/cache/yatube.
+PAGE_CACHE = os.environ.get('PAGE_CACHE', '') not in ('', '0')
+SHARED_CACHE_DIR = os.environ.get('SHARED_CACHE_DIR')
+
 ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
@@ -60,9 +66,52 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'feeds': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'feeds',
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+        },
+    },
 }
 
+if PAGE_CACHE:
+    MIDDLEWARE.insert(1, 'posts.middleware.AnonymousPageCacheMiddleware')
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index(
+            'django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+        'posts.middleware.AuthenticatedPageCacheMiddleware')
+
+if SHARED_CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.cache_backends.TwoTierCache',
+            'LOCATION': os.path.join(SHARED_CACHE_DIR, 'default.journal'),
+            'OPTIONS': {
+                'L2': 'shared',
+                'MAX_ENTRIES': 1000,
+                'L1_TIMEOUT': 60,
+            },
+        },
+        'shared': {
+            'BACKEND': 'yatube.cache_backends.SQLiteCache',
+            'LOCATION': os.path.join(SHARED_CACHE_DIR, 'default.sqlite3'),
+            'OPTIONS': {
+                'MAX_ENTRIES': 50000,
+                'MAX_SIZE': 256 * 1024 * 1024,
+            },
+        },
+        'feeds': {
+            'BACKEND': 'yatube.cache_backends.SQLiteCache',
+            'LOCATION': os.path.join(SHARED_CACHE_DIR, 'feeds.sqlite3'),
+            'OPTIONS': {
+                'MAX_ENTRIES': 2000,
+                'MAX_SIZE': 64 * 1024 * 1024,
+            },
+        },
+    }
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -100,9 +149,20 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_MAX_AGE = 60 * 60 * 24
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_PREFIX = '/internal-media/'
 
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = 'posts:index'
 
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+
+# Число процессов для миниатюр (в продакшене, например, 2); 0 — создавать
+# в процессе запроса, пустое значение — не создавать вовсе.
+THUMBNAIL_WORKERS = os.environ.get('THUMBNAIL_WORKERS', '0')
+THUMBNAIL_WORKERS = int(THUMBNAIL_WORKERS) if THUMBNAIL_WORKERS else None
+
+IMAGE_MAX_SIDE = 2048
+IMAGE_MAX_PIXELS = 50_000_000
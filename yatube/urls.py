@@ -4,11 +4,15 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from .media import serve_media
+
 handler404 = 'posts.views.page_not_found'  # noqa
 handler500 = 'posts.views.server_error'  # noqa
 
 urlpatterns = [
     path('yatube_admin/', admin.site.urls),
+    path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>', serve_media,
+         name='media'),
     path('', include('posts.urls', namespace='posts')),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
@@ -16,9 +20,6 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(
-        settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
-    )
     urlpatterns += static(
         settings.STATIC_URL, document_root=settings.STATIC_ROOT
     )